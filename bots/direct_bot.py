@@ -13,6 +13,7 @@ from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import urllib3
 
@@ -133,6 +134,11 @@ class DirectBot(BaseBot):
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        # Pool amplio (sin reintentos extra): la sesión la comparten validador y
+        # enriquecedor, que piden en paralelo a muchos hosts distintos
+        adapter = HTTPAdapter(pool_connections=50, pool_maxsize=50)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # === API Cost Tracking ===
         self.api_calls = {
@@ -39,6 +39,7 @@ CX_ID = os.getenv('CX_ID', '')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '')
 TELEGRAM_BOT_TOKEN = TELEGRAM_TOKEN  # Alias
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
+TELEGRAM_COALESCE_SECS = float(os.getenv('TELEGRAM_COALESCE_SECS', '5'))  # Agrupar avisos de leads
 
 # === HUNTER.IO ===
 HUNTER_KEY = os.getenv('HUNTER_KEY', '')
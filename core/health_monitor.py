@@ -206,8 +206,8 @@ class HealthMonitor:
             from staffkit_client import StaffKitClient
             import config
             
-            client = StaffKitClient()
-            result = client.check_connection()
+            with StaffKitClient() as client:
+                result = client.check_connection()
             
             healthy = result.get('status') == 'ok'
             
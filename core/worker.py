@@ -310,7 +310,6 @@ def create_direct_executor(config: Dict = None):
         bot_config = {**(config or {}), **params}
         
         bot = DirectBot(config=bot_config)
-        client = StaffKitClient()
         
         # Ejecutar búsqueda
         query = params.get('query', config.get('DEFAULT_QUERY', 'empresas sostenibles España'))
@@ -322,12 +321,13 @@ def create_direct_executor(config: Dict = None):
         saved = 0
         duplicates = 0
         
-        for lead in leads:
-            result = client.submit_lead(lead, source='direct_bot')
-            if result.get('status') == 'success':
-                saved += 1
-            elif result.get('status') == 'duplicate':
-                duplicates += 1
+        with StaffKitClient() as client:
+            for lead in leads:
+                result = client.submit_lead(lead, source='direct_bot')
+                if result.get('status') == 'success':
+                    saved += 1
+                elif result.get('status') == 'duplicate':
+                    duplicates += 1
         
         return {
             'leads_found': len(leads),
@@ -353,7 +353,6 @@ def create_resentment_executor(config: Dict = None):
         bot_config = {**(config or {}), **params}
         
         bot = ResentmentBot(config=bot_config)
-        client = StaffKitClient()
         
         # Ejecutar búsqueda
         platforms = params.get('platforms', ['trustpilot', 'reddit'])
@@ -367,12 +366,13 @@ def create_resentment_executor(config: Dict = None):
         saved = 0
         duplicates = 0
         
-        for lead in leads:
-            result = client.submit_lead(lead, source='resentment_bot')
-            if result.get('status') == 'success':
-                saved += 1
-            elif result.get('status') == 'duplicate':
-                duplicates += 1
+        with StaffKitClient() as client:
+            for lead in leads:
+                result = client.submit_lead(lead, source='resentment_bot')
+                if result.get('status') == 'success':
+                    saved += 1
+                elif result.get('status') == 'duplicate':
+                    duplicates += 1
         
         return {
             'leads_found': len(leads),
@@ -398,7 +398,6 @@ def create_social_executor(config: Dict = None):
         bot_config = {**(config or {}), **params}
         
         bot = SocialBot(config=bot_config)
-        client = StaffKitClient()
         
         # Ejecutar búsqueda
         leads = bot.search()
@@ -407,12 +406,13 @@ def create_social_executor(config: Dict = None):
         saved = 0
         duplicates = 0
         
-        for lead in leads:
-            result = client.submit_lead(lead, source='social_bot')
-            if result.get('status') == 'success':
-                saved += 1
-            elif result.get('status') == 'duplicate':
-                duplicates += 1
+        with StaffKitClient() as client:
+            for lead in leads:
+                result = client.submit_lead(lead, source='social_bot')
+                if result.get('status') == 'success':
+                    saved += 1
+                elif result.get('status') == 'duplicate':
+                    duplicates += 1
         
         return {
             'leads_found': len(leads),
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+JSON rápido (orjson si está instalado, json estándar si no) y troceado en lotes,
+compartidos por los clientes de StaffKit / SAP y los scripts de test de SAP
+"""
+
+import json
+from itertools import islice
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def json_loads(data):
+    """Parsea JSON de str o bytes"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_body(response):
+    """Parsea el JSON de una respuesta HTTP (requests o httpx) directamente de los bytes"""
+    if HAS_ORJSON:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def json_bytes(obj) -> bytes:
+    """Serializa a JSON compacto"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def json_pretty(obj) -> str:
+    """Serializa a JSON con indentación (ficheros de estado)"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+
+def chunks(items, size: int):
+    """Trocea un iterable en listas de como máximo `size` elementos"""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Consultas $count agrupadas en una sola petición $batch (OData) al Service Layer.
+
+Uso:
+    counts = batch_counts(session, SAP_URL, {
+        'Total BP': None,
+        'BP con email': "EmailAddress gt ''",
+    })
+    # {'Total BP': '1234', 'BP con email': '567'}
+"""
+
+import uuid
+from email.parser import BytesParser
+from typing import Dict, Optional
+from urllib.parse import quote, urlparse
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+
+def _batch_body(base_path: str, filters: Dict[str, Optional[str]], boundary: str) -> bytes:
+    """Cuerpo multipart/mixed con un GET .../$count por filtro"""
+    parts = []
+    for filter_str in filters.values():
+        url = f"{base_path}/BusinessPartners/$count"
+        if filter_str:
+            url += f"?$filter={quote(filter_str, safe='')}"
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            "Content-Transfer-Encoding: binary\r\n"
+            "\r\n"
+            f"GET {url} HTTP/1.1\r\n"
+            "\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return ''.join(parts).encode('utf-8')
+
+
+def _parse_part(payload: str) -> str:
+    """Extraer el cuerpo de una sub-respuesta HTTP ('HTTP/1.1 200 OK ... \\r\\n\\r\\n1234')"""
+    head, _, body = payload.replace('\r\n', '\n').partition('\n\n')
+    status = head.partition('\n')[0]
+    if status.split()[1:2] != ['200']:
+        return f"error ({status.strip()})"
+    return body.strip()
+
+
+def batch_counts(session, sap_url: str, filters: Dict[str, Optional[str]], timeout: int = 30) -> Dict[str, str]:
+    """
+    Ejecutar varios BusinessPartners/$count en un único POST a /$batch
+
+    Args:
+        session: requests.Session ya logueada (cookie B1SESSION)
+        sap_url: URL base del Service Layer (https://host:50000/b1s/v1)
+        filters: {etiqueta: $filter} (None = sin filtro)
+
+    Returns:
+        {etiqueta: resultado del $count (texto)}, en el orden de `filters`
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    body = _batch_body(urlparse(sap_url).path.rstrip('/'), filters, boundary)
+    # httpx (cliente HTTP/2) recibe el cuerpo en bruto como content=, requests como data=
+    is_httpx = HAS_HTTPX and isinstance(session, httpx.Client)
+    response = session.post(
+        f"{sap_url.rstrip('/')}/$batch",
+        **({'content': body} if is_httpx else {'data': body}),
+        headers={'Content-Type': f'multipart/mixed; boundary={boundary}'},
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+    # El parser de email entiende multipart/mixed si se le antepone la cabecera
+    message = BytesParser().parsebytes(
+        b'Content-Type: ' + response.headers['Content-Type'].encode('latin-1') + b'\r\n\r\n'
+        + response.content
+    )
+    results = [_parse_part(part.get_payload()) for part in message.get_payload()]
+    return dict(zip(filters, results))
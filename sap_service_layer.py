@@ -23,17 +23,27 @@ Uso:
 import argparse
 import json
 import logging
+import math
 import os
 import re
 import sys
 import urllib3
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional, List, Dict, Any
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Desactivar warnings de SSL (muchos SAP usan certificados self-signed)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from json_utils import chunks as _chunks, json_body as _json_body, json_loads, json_pretty
+
+# Certificado (PEM) del servidor SAP para verificar TLS. Sin él se acepta
+# cualquier certificado: muchos SAP usan certificados self-signed
+SAP_CA_BUNDLE = os.getenv('SAP_CA_BUNDLE', '')
+
+if not SAP_CA_BUNDLE:
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ============================================================================
 # CONFIGURACIÓN
@@ -41,14 +51,40 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 STATE_DIR = '/var/www/vhosts/territoriodrasanvicr.com/b/sync_state'
 STAFFKIT_URL = 'https://staff.replanta.dev'
+STAFFKIT_BULK_SIZE = 200  # Contactos por petición a sync_sap_lead_bulk
+STAFFKIT_MAX_WORKERS = 10  # POSTs simultáneos a StaffKit si no hay endpoint bulk
+SL_SESSION_TTL = timedelta(minutes=25)  # SL cierra sesiones tras 30 min sin uso
 
 # Dominios de email genéricos (no corporativos)
-GENERIC_DOMAINS = {
+GENERIC_DOMAINS = frozenset({
     'gmail.com', 'hotmail.com', 'hotmail.es', 'outlook.com', 'outlook.es',
     'yahoo.com', 'yahoo.es', 'live.com', 'msn.com', 'icloud.com',
     'protonmail.com', 'mail.com', 'aol.com', 'zoho.com',
     'telefonica.net', 'orange.es', 'vodafone.es', 'movistar.es'
-}
+})
+
+# Reintentos con backoff exponencial ante cortes y 429/5xx transitorios (SL y StaffKit)
+HTTP_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 502, 503, 504],
+    allowed_methods=frozenset({'GET', 'POST'})
+)
+
+# Sesión HTTP compartida para StaffKit: reutiliza conexiones TCP/TLS entre llamadas
+_STAFFKIT = requests.Session()
+_STAFFKIT.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=HTTP_RETRY
+))
+_STAFFKIT.headers.update({'User-Agent': 'BotScrap-External/1.0'})
+
+# Separadores cuando un campo de email trae varias direcciones
+_EMAIL_SPLIT = re.compile(r'[;,\s]+')
+
+# Estado por bot ya leído/escrito en este proceso
+_state_cache = {}
 
 # Logging
 logging.basicConfig(
@@ -58,6 +94,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Directorio de estado: se crea una sola vez al importar
+try:
+    os.makedirs(STATE_DIR, exist_ok=True)
+except PermissionError as e:
+    logger.warning(f"No se pudo crear {STATE_DIR}: {e}")
+
 
 # ============================================================================
 # CLASE SAP SERVICE LAYER CLIENT
@@ -66,18 +108,83 @@ logger = logging.getLogger(__name__)
 class SAPServiceLayerClient:
     """Cliente para SAP Business One Service Layer"""
     
-    def __init__(self, base_url: str, company_db: str, username: str, password: str):
+    def __init__(self, base_url: str, company_db: str, username: str, password: str,
+                 reuse_session: bool = True):
         self.base_url = base_url.rstrip('/')
         self.api_url = f"{self.base_url}/b1s/v1"
         self.company_db = company_db
         self.username = username
         self.password = password
+        self.reuse_session = reuse_session  # Guardar cookie B1SESSION entre ejecuciones
         self.session = requests.Session()
-        self.session.verify = False  # SAP suele usar certificados self-signed
+        self.session.verify = SAP_CA_BUNDLE or False
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, HTTPAdapter(max_retries=HTTP_RETRY))
+        # Respuestas comprimidas y sin anotaciones OData por entidad
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Prefer": "odata.metadata=minimal"
+        })
         self.logged_in = False
+    
+    def _session_file(self) -> str:
+        """Fichero donde se guarda la cookie de sesión de esta CompanyDB"""
+        safe_db = re.sub(r'[^A-Za-z0-9_.-]', '_', self.company_db)
+        return os.path.join(STATE_DIR, f'sl_session_{safe_db}.json')
+    
+    def _restore_session(self) -> bool:
+        """Reutilizar la sesión guardada si no ha caducado y SAP la acepta"""
+        try:
+            with open(self._session_file(), 'r') as f:
+                saved = json.load(f)
+            expires = datetime.fromisoformat(saved['expires'])
+        except (OSError, ValueError, KeyError):
+            return False
+        
+        if (saved.get('base_url') != self.base_url or saved.get('username') != self.username
+                or expires <= datetime.now()):
+            return False
         
+        self.session.cookies.update(saved.get('cookies', {}))
+        try:
+            response = self.session.get(
+                f"{self.api_url}/BusinessPartners",
+                params={"$top": 1, "$select": "CardCode"},
+                timeout=30
+            )
+            if response.status_code == 200:
+                return True
+        except Exception as e:
+            logger.debug(f"Sesión guardada no válida: {e}")
+        
+        self.session.cookies.clear()
+        return False
+    
+    def _save_session(self):
+        """Guardar la cookie de sesión (solo legible por el usuario) con su caducidad"""
+        session_file = self._session_file()
+        tmp_file = session_file + '.tmp'
+        data = {
+            'base_url': self.base_url,
+            'username': self.username,
+            'cookies': self.session.cookies.get_dict(),
+            'expires': (datetime.now() + SL_SESSION_TTL).isoformat()
+        }
+        try:
+            fd = os.open(tmp_file, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, session_file)
+        except OSError as e:
+            logger.debug(f"No se pudo guardar la sesión SL: {e}")
+    
     def login(self) -> bool:
-        """Autenticarse en Service Layer"""
+        """Autenticarse en Service Layer (reutiliza la sesión previa si sigue viva)"""
+        if self.reuse_session and self._restore_session():
+            self.logged_in = True
+            logger.info(f"Sesión reutilizada en {self.company_db}")
+            return True
+        
         try:
             response = self.session.post(
                 f"{self.api_url}/Login",
@@ -93,6 +200,8 @@ class SAPServiceLayerClient:
             if response.status_code == 200:
                 self.logged_in = True
                 logger.info(f"Login exitoso en {self.company_db}")
+                if self.reuse_session:
+                    self._save_session()
                 return True
             else:
                 logger.error(f"Login fallido: {response.status_code} - {response.text}")
@@ -103,8 +212,13 @@ class SAPServiceLayerClient:
             return False
     
     def logout(self):
-        """Cerrar sesión"""
+        """Cerrar sesión (o dejarla viva para la siguiente ejecución si reuse_session)"""
         if self.logged_in:
+            if self.reuse_session:
+                # SL caduca por inactividad: renovar la caducidad guardada
+                self._save_session()
+                self.logged_in = False
+                return
             try:
                 self.session.post(f"{self.api_url}/Logout", timeout=10)
                 logger.info("Logout completado")
@@ -118,7 +232,8 @@ class SAPServiceLayerClient:
         groups: List[str] = None,
         last_cardcode: str = '',
         limit: int = 500,
-        include_inactive: bool = False
+        include_inactive: bool = False,
+        corporate_only: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Obtener Business Partners con filtros.
@@ -126,9 +241,10 @@ class SAPServiceLayerClient:
         Args:
             card_type: Tipo de socio (cCustomer=cliente, cSupplier=proveedor)
             groups: Lista de códigos de grupo a filtrar
-            last_cardcode: Para paginación incremental
+            last_cardcode: Último CardCode ya sincronizado (incremental)
             limit: Máximo de registros
             include_inactive: Incluir inactivos
+            corporate_only: Excluir en SAP los emails de GENERIC_DOMAINS
         
         Returns:
             Lista de business partners
@@ -138,7 +254,6 @@ class SAPServiceLayerClient:
             return []
         
         all_partners = []
-        skip = 0
         page_size = 20  # SAP Service Layer tiene límite de 20 por defecto
         
         # Construir filtro OData
@@ -149,20 +264,23 @@ class SAPServiceLayerClient:
             group_filters = [f"GroupCode eq {g}" for g in groups]
             filters.append(f"({' or '.join(group_filters)})")
         
-        # Solo con email
-        filters.append("EmailAddress ne ''")
-        filters.append("EmailAddress ne null")
+        # Solo con email: "gt ''" descarta a la vez vacíos y NULL (un solo predicado)
+        filters.append("EmailAddress gt ''")
         
         # Solo activos (salvo que se pida incluir inactivos)
         if not include_inactive:
             filters.append("Valid eq 'tYES'")
         
-        # Incremental: desde último CardCode
-        if last_cardcode:
-            filters.append(f"CardCode gt '{last_cardcode}'")
-        
         filter_str = " and ".join(filters)
         
+        # Solo corporativos: que SAP no devuelva los emails genéricos. Sin ello se
+        # filtra igual en Python (main), así que es el filtro de respaldo
+        base_filter_str = filter_str
+        if corporate_only:
+            filter_str = " and ".join([filter_str] + [
+                f"not endswith(tolower(EmailAddress), '@{d}')" for d in sorted(GENERIC_DOMAINS)
+            ])
+        
         # Campos a seleccionar (nombres según Service Layer de SAP B1)
         select_fields = [
             "CardCode", "CardName", "CardForeignName",
@@ -174,46 +292,89 @@ class SAPServiceLayerClient:
         
         logger.info(f"Extrayendo {card_type} (grupos={groups}, desde={last_cardcode or 'inicio'})...")
         
-        while len(all_partners) < limit:
-            try:
-                response = self.session.get(
-                    f"{self.api_url}/BusinessPartners",
-                    params={
-                        "$filter": filter_str,
-                        "$select": ",".join(select_fields),
-                        "$orderby": "CardCode asc",
-                        "$top": min(page_size, limit - len(all_partners)),
-                        "$skip": skip
-                    },
-                    timeout=60
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Error API: {response.status_code} - {response.text[:200]}")
-                    break
-                
-                data = response.json()
-                partners = data.get('value', [])
-                
-                if not partners:
-                    break
-                
-                all_partners.extend(partners)
-                logger.info(f"  Página {skip//page_size + 1}: {len(partners)} registros")
-                
-                # ¿Hay más páginas?
-                if len(partners) < page_size:
-                    break
-                
-                skip += page_size
-                
-            except Exception as e:
-                logger.error(f"Error obteniendo partners: {e}")
+        params = {
+            "$select": ",".join(select_fields),
+            # Necesario para el keyset: SAP lo resuelve recorriendo el índice de CardCode
+            "$orderby": "CardCode asc"
+        }
+        
+        # Paginación keyset: cada página pide CardCode > último CardCode visto,
+        # sin $skip, así SAP no recorre de nuevo las filas ya devueltas.
+        # La primera página trae además el total ($inlinecount) para no pedir
+        # una página vacía al final.
+        after = last_cardcode
+        target = limit
+        page = 0
+        
+        while len(all_partners) < target:
+            # Solo se tolera el error en la primera página con el filtro de emails
+            # corporativos (se reintenta sin él); cualquier otro aborta la extracción
+            may_reject = page == 0 and filter_str != base_filter_str
+            data = self._get_partners_page(
+                params, filter_str, after,
+                top=min(page_size, target - len(all_partners)),
+                with_count=(page == 0),
+                may_reject=may_reject
+            )
+            if data is None and may_reject:
+                # Hay versiones del SL que no aceptan endswith/tolower en $filter
+                logger.warning("SAP rechazó el filtro de emails corporativos, se filtra en Python")
+                filter_str = base_filter_str
+                continue
+            
+            partners = data.get('value', []) if data else []
+            if not partners:
                 break
+            
+            if page == 0:
+                total = data.get('odata.count', data.get('@odata.count'))
+                if total is not None:
+                    target = min(int(total), limit)
+                    logger.info(f"  Total en SAP: {total} ({math.ceil(target / page_size)} páginas)")
+            
+            page += 1
+            all_partners.extend(partners)
+            logger.info(f"  Página {page}: {len(partners)} registros")
+            
+            # ¿Hay más páginas?
+            if len(partners) < page_size:
+                break
+            
+            after = partners[-1]['CardCode']
         
         logger.info(f"Total extraídos: {len(all_partners)}")
         return all_partners
     
+    def _get_partners_page(self, params: Dict[str, Any], filter_str: str, after: str,
+                           top: int, with_count: bool = False,
+                           may_reject: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Obtener una página de Business Partners con CardCode > after.
+        Si SAP responde error: None con may_reject, si no HTTPError.
+        """
+        if after:
+            after_escaped = after.replace("'", "''")
+            filter_str = f"{filter_str} and CardCode gt '{after_escaped}'"
+        
+        page_params = {**params, "$filter": filter_str, "$top": top}
+        if with_count:
+            page_params["$inlinecount"] = "allpages"
+        
+        # Los errores de red ya se reintentan en el adapter; si aun así falla, se propaga
+        response = self.session.get(
+            f"{self.api_url}/BusinessPartners",
+            params=page_params,
+            timeout=60
+        )
+        
+        if response.status_code != 200:
+            logger.error(f"Error API: {response.status_code} - {response.text[:200]}")
+            if may_reject:
+                return None
+            response.raise_for_status()
+        
+        return _json_body(response)
+    
     def get_groups(self, card_type: str = 'cCustomer') -> List[Dict[str, Any]]:
         """Obtener lista de grupos de Business Partners"""
         if not self.logged_in:
@@ -229,7 +390,7 @@ class SAPServiceLayerClient:
             )
             
             if response.status_code == 200:
-                all_groups = response.json().get('value', [])
+                all_groups = _json_body(response).get('value', [])
                 # Filtrar por tipo
                 if card_type == 'cSupplier':
                     return [g for g in all_groups if g.get('Type') == 'bbpgt_VendorGroup']
@@ -249,33 +410,33 @@ class SAPServiceLayerClient:
 # ============================================================================
 
 def is_corporate_email(email: str) -> bool:
-    """Verifica si es email corporativo"""
-    if not email or '@' not in email:
-        return False
-    domain = email.lower().split('@')[1]
-    return domain not in GENERIC_DOMAINS
+    """Verifica si es email corporativo (espera el email ya en minúsculas, de clean_email)"""
+    at = email.rfind('@') if email else -1
+    return at > 0 and email[at + 1:] not in GENERIC_DOMAINS
 
 
 def clean_email(email: str) -> str:
     """Limpia y extrae primer email válido"""
     if not email:
         return ''
-    emails = re.split(r'[;,\s]+', str(email))
-    for e in emails:
+    for e in _EMAIL_SPLIT.split(str(email)):
         e = e.strip().lower()
-        if '@' in e and '.' in e.split('@')[1]:
+        at = e.find('@')
+        if at > 0 and e.find('.', at + 1) > at:
             return e
     return ''
 
 
 def load_state(bot_id: int) -> dict:
-    """Carga estado del bot"""
-    os.makedirs(STATE_DIR, exist_ok=True)
+    """Carga estado del bot (se lee de disco una vez por proceso)"""
+    if bot_id in _state_cache:
+        return dict(_state_cache[bot_id])
     state_file = os.path.join(STATE_DIR, f'sap_sl_bot_{bot_id}.json')
     if os.path.exists(state_file):
         try:
             with open(state_file, 'r') as f:
-                return json.load(f)
+                _state_cache[bot_id] = json_loads(f.read())
+                return dict(_state_cache[bot_id])
         except:
             pass
     return {
@@ -287,95 +448,238 @@ def load_state(bot_id: int) -> dict:
 
 
 def save_state(bot_id: int, state: dict):
-    """Guarda estado del bot"""
-    os.makedirs(STATE_DIR, exist_ok=True)
+    """Guarda estado del bot (escritura atómica: tmp + os.replace)"""
     state_file = os.path.join(STATE_DIR, f'sap_sl_bot_{bot_id}.json')
+    tmp_file = state_file + '.tmp'
     state['last_sync'] = datetime.now().isoformat()
-    with open(state_file, 'w') as f:
-        json.dump(state, f, indent=2)
-
-
-def transform_partner(partner: dict, card_type: str) -> dict:
-    """Transforma un Business Partner al formato de StaffKit"""
-    email = clean_email(partner.get('EmailAddress', ''))
+    with open(tmp_file, 'w') as f:
+        f.write(json_pretty(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, state_file)
+    _state_cache[bot_id] = dict(state)
+
+
+def transform_partner(partner: dict, card_type: str, email: str = None,
+                      partner_type: str = None) -> dict:
+    """
+    Transforma un Business Partner al formato de StaffKit.
+    
+    Si el llamador ya limpió el email (clean_email) o calculó el partner_type
+    para todo el lote, puede pasarlos para no repetir el trabajo por fila.
+    """
+    get = partner.get
+    
+    if email is None:
+        email = clean_email(get('EmailAddress', ''))
     
     if not email:
         return None
     
+    if partner_type is None:
+        partner_type = 'customer' if card_type == 'cCustomer' else 'supplier'
+    
     # Website con fallback al dominio del email
-    website = (partner.get('Website') or '').strip()
-    if not website and email and is_corporate_email(email):
-        domain = email.split('@')[1]
-        website = f"https://{domain}"
+    website = (get('Website') or '').strip()
+    if not website and is_corporate_email(email):
+        website = f"https://{email[email.rfind('@') + 1:]}"
     
     # Teléfono: preferir fijo, si no móvil
-    phone = (partner.get('Phone1') or partner.get('Phone2') or '').strip()
+    phone = (get('Phone1') or get('Phone2') or '').strip()
     if not phone or phone == '0':
-        phone = (partner.get('Cellular') or '').strip()
+        phone = (get('Cellular') or '').strip()
     
     # Nombre: CardForeignName suele ser el nombre comercial
-    company_name = (partner.get('CardForeignName') or partner.get('CardName') or '').strip()
-    contact_name = (partner.get('ContactPerson') or '').strip()
-    
     return {
-        'cardcode': partner.get('CardCode', ''),
-        'company': company_name,
-        'name': contact_name,
+        'cardcode': get('CardCode', ''),
+        'company': (get('CardForeignName') or get('CardName') or '').strip(),
+        'name': (get('ContactPerson') or '').strip(),
         'email': email,
         'phone': phone,
-        'city': partner.get('City', ''),
-        'country': partner.get('Country', 'ES'),
-        'address': partner.get('Address', ''),
-        'zipcode': partner.get('ZipCode', ''),
+        'city': get('City', ''),
+        'country': get('Country', 'ES'),
+        'address': get('Address', ''),
+        'zipcode': get('ZipCode', ''),
         'website': website,
-        'group_code': partner.get('GroupCode', ''),
-        'partner_type': 'customer' if card_type == 'cCustomer' else 'supplier',
-        'notes': partner.get('Notes', '')
+        'group_code': get('GroupCode', ''),
+        'partner_type': partner_type,
+        'notes': get('Notes', '')
     }
 
 
-def send_to_staffkit(contacts: list, list_id: int, api_key: str) -> dict:
-    """Envía contactos a StaffKit en batch"""
-    if not contacts:
-        return {'success': True, 'saved': 0, 'duplicates': 0}
+def _staffkit_payload(contact: dict) -> dict:
+    """Campos de un contacto tal como los espera sync_sap_lead"""
+    return {
+        'cardcode': contact['cardcode'],
+        'company': contact['company'],
+        'name': contact['name'],
+        'email': contact['email'],
+        'phone': contact['phone'],
+        'city': contact['city'],
+        'country': contact['country'],
+        'address': contact['address'],
+        'zipcode': contact['zipcode'],
+        'website': contact['website']
+    }
+
+
+def advance_watermark(state: dict, contacts: list):
+    """Avanza last_cardcode_* con el mayor CardCode de cada tipo en `contacts`"""
+    for partner_type in ('customer', 'supplier'):
+        codes = [c['cardcode'] for c in contacts if c['partner_type'] == partner_type]
+        if codes:
+            key = f'last_cardcode_{partner_type}'
+            state[key] = max(state.get(key, ''), max(codes))
+
+
+def send_to_staffkit_bulk(contacts: list, list_id: int, api_key: str,
+                          batch_size: int = STAFFKIT_BULK_SIZE,
+                          on_chunk: Callable[[list], None] = None) -> Optional[dict]:
+    """
+    Envía contactos a StaffKit en lotes (una petición por lote).
     
+    `on_chunk(contacts)` se llama tras cada lote aceptado, con sus contactos hasta
+    el primero que falló, mientras no haya fallado ninguno anterior, para poder
+    guardar el progreso lote a lote.
+    
+    Petición: POST bots.php?action=sync_sap_lead_bulk con
+    {'api_key', 'list_id', 'contacts': [...]}; respuesta {'results': [...]} con
+    un {'success', 'status': created|updated|unchanged, 'error'} por contacto.
+    
+    Returns:
+        Dict con saved/duplicates/errors, o None si StaffKit no tiene
+        el endpoint bulk (404/501, 400 o acción desconocida) y hay que usar
+        el envío uno a uno.
+    """
     saved = 0
     duplicates = 0
+    errors = 0
+    sent = 0
+    contiguous = True  # Todos los lotes anteriores aceptados
     
-    for contact in contacts:
+    for chunk in _chunks(contacts, batch_size):
         try:
-            response = requests.post(
+            response = _STAFFKIT.post(
                 f"{STAFFKIT_URL}/api/bots.php",
-                params={'action': 'sync_sap_lead'},
+                params={'action': 'sync_sap_lead_bulk'},
                 json={
                     'api_key': api_key,
                     'list_id': list_id,
-                    'cardcode': contact['cardcode'],
-                    'company': contact['company'],
-                    'name': contact['name'],
-                    'email': contact['email'],
-                    'phone': contact['phone'],
-                    'city': contact['city'],
-                    'country': contact['country'],
-                    'address': contact['address'],
-                    'zipcode': contact['zipcode'],
-                    'website': contact['website']
+                    'contacts': [_staffkit_payload(c) for c in chunk]
                 },
-                timeout=30
+                timeout=60
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success'):
-                    if result.get('action') == 'created':
-                        saved += 1
-                    else:
-                        duplicates += 1
-            
         except Exception as e:
-            logger.warning(f"Error enviando {contact['cardcode']}: {e}")
+            logger.warning(f"Error enviando lote de {len(chunk)} contactos: {e}")
+            errors += len(chunk)
+            sent += len(chunk)
+            contiguous = False
+            continue
+        
+        try:
+            rows = _json_body(response).get('results') if response.status_code == 200 else None
+        except ValueError:
+            rows = None
+        
+        if not (isinstance(rows, list) and len(rows) == len(chunk)):
+            if response.status_code in (200, 400, 404, 501):
+                # Sin endpoint bulk (o respuesta sin resultados por contacto)
+                if not sent:
+                    return None
+                # Ya se enviaron lotes: no reenviar esos contactos
+                logger.warning("Endpoint bulk dejó de responder, enviando el resto uno a uno")
+                fallback = send_to_staffkit(contacts[sent:], list_id, api_key, bulk=False,
+                                            on_chunk=on_chunk if contiguous else None)
+                return {
+                    'success': True,
+                    'saved': saved + fallback['saved'],
+                    'duplicates': duplicates + fallback['duplicates'],
+                    'errors': errors + fallback.get('errors', 0)
+                }
+            
+            logger.warning(f"Error API bulk: {response.status_code} - {response.text[:200]}")
+            errors += len(chunk)
+            sent += len(chunk)
+            contiguous = False
+            continue
+        
+        failed_at = None  # Primer contacto del lote que falló
+        for i, row in enumerate(rows):
+            if not row.get('success'):
+                errors += 1
+                if failed_at is None:
+                    failed_at = i
+            elif row.get('status') == 'created':
+                saved += 1
+            else:
+                duplicates += 1
+        
+        sent += len(chunk)
+        logger.info(f"  Lote enviado: {sent}/{len(contacts)} contactos")
+        
+        # Progreso: solo hasta el primer contacto que falló (como en el envío uno a uno)
+        done = chunk if failed_at is None else chunk[:failed_at]
+        if on_chunk and contiguous and done:
+            on_chunk(done)
+        if failed_at is not None:
+            contiguous = False
+    
+    return {'success': True, 'saved': saved, 'duplicates': duplicates, 'errors': errors}
+
+
+def _send_one(contact: dict, list_id: int, api_key: str) -> str:
+    """Envía un contacto con sync_sap_lead. Devuelve 'created', 'duplicate' o 'error'"""
+    try:
+        response = _STAFFKIT.post(
+            f"{STAFFKIT_URL}/api/bots.php",
+            params={'action': 'sync_sap_lead'},
+            json={
+                'api_key': api_key,
+                'list_id': list_id,
+                **_staffkit_payload(contact)
+            },
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = _json_body(response)
+            if result.get('success'):
+                return 'created' if result.get('action') == 'created' else 'duplicate'
+        return 'error'
+        
+    except Exception as e:
+        logger.warning(f"Error enviando {contact['cardcode']}: {e}")
+        return 'error'
+
+
+def send_to_staffkit(contacts: list, list_id: int, api_key: str, bulk: bool = True,
+                     on_chunk: Callable[[list], None] = None) -> dict:
+    """Envía contactos a StaffKit en batch (ver send_to_staffkit_bulk para on_chunk)"""
+    if not contacts:
+        return {'success': True, 'saved': 0, 'duplicates': 0, 'errors': 0}
+    
+    if bulk:
+        result = send_to_staffkit_bulk(contacts, list_id, api_key, on_chunk=on_chunk)
+        if result is not None:
+            return result
+        logger.info("StaffKit sin endpoint bulk, enviando uno a uno")
+    
+    # Sin endpoint bulk: un POST por contacto, varios en paralelo
+    with ThreadPoolExecutor(max_workers=STAFFKIT_MAX_WORKERS) as executor:
+        outcomes = list(executor.map(lambda c: _send_one(c, list_id, api_key), contacts))
     
-    return {'success': True, 'saved': saved, 'duplicates': duplicates}
+    # Progreso: solo hasta el primer contacto que falló
+    if on_chunk:
+        done = contacts[:outcomes.index('error')] if 'error' in outcomes else contacts
+        if done:
+            on_chunk(done)
+    
+    return {
+        'success': True,
+        'saved': outcomes.count('created'),
+        'duplicates': outcomes.count('duplicate'),
+        'errors': outcomes.count('error')
+    }
 
 
 # ============================================================================
@@ -385,14 +689,14 @@ def send_to_staffkit(contacts: list, list_id: int, api_key: str) -> dict:
 def get_bot_config(bot_id: int, api_key: str) -> Optional[dict]:
     """Obtiene configuración del bot desde StaffKit API v2"""
     try:
-        response = requests.get(
+        response = _STAFFKIT.get(
             f"{STAFFKIT_URL}/api/v2/external-bot.php",
             params={'id': bot_id},
             headers={'Authorization': f'Bearer {api_key}'},
             timeout=30
         )
         if response.status_code == 200:
-            data = response.json()
+            data = _json_body(response)
             if data.get('success'):
                 return data.get('bot')
         else:
@@ -517,7 +821,8 @@ def main():
         
         for card_type in card_types:
             type_name = 'clientes' if card_type == 'cCustomer' else 'proveedores'
-            last_key = f'last_cardcode_{"customer" if card_type == "cCustomer" else "supplier"}'
+            partner_type = 'customer' if card_type == 'cCustomer' else 'supplier'
+            last_key = f'last_cardcode_{partner_type}'
             last_cardcode = state.get(last_key, '')
             
             logger.info(f"\n{'='*60}")
@@ -529,23 +834,22 @@ def main():
                 groups=groups,
                 last_cardcode=last_cardcode,
                 limit=config['limit'],
-                include_inactive=config.get('include_inactive', False)
+                include_inactive=config.get('include_inactive', False),
+                corporate_only=config['corporate_only']
             )
             
-            # Transformar y filtrar
+            # Filtrar antes de transformar: los descartados no construyen el dict
+            type_contacts = []
             for partner in partners:
-                contact = transform_partner(partner, card_type)
-                if contact:
-                    # Filtrar emails corporativos si está configurado
-                    if config['corporate_only'] and not is_corporate_email(contact['email']):
-                        continue
-                    all_contacts.append(contact)
-                    
-                    # Actualizar último CardCode
-                    if contact['cardcode'] > state.get(last_key, ''):
-                        state[last_key] = contact['cardcode']
+                email = clean_email(partner.get('EmailAddress', ''))
+                # Filtrar emails corporativos (ya filtrado en SAP; defensa si el campo trae varios emails)
+                if not email or (config['corporate_only'] and not is_corporate_email(email)):
+                    continue
+                type_contacts.append(transform_partner(partner, card_type, email, partner_type))
             
-            logger.info(f"  {type_name.capitalize()} válidos: {len([c for c in all_contacts if c['partner_type'] == ('customer' if card_type == 'cCustomer' else 'supplier')])}")
+            all_contacts.extend(type_contacts)
+            
+            logger.info(f"  {type_name.capitalize()} válidos: {len(type_contacts)}")
         
         logger.info(f"\n{'='*60}")
         logger.info(f"TOTAL CONTACTOS: {len(all_contacts)}")
@@ -562,15 +866,25 @@ def main():
         # Enviar a StaffKit
         if config.get('list_id') and args.api_key:
             logger.info(f"\nEnviando a StaffKit (lista {config['list_id']})...")
-            result = send_to_staffkit(all_contacts, config['list_id'], args.api_key)
             
-            logger.info(f"  Guardados: {result['saved']}")
-            logger.info(f"  Duplicados: {result['duplicates']}")
+            def checkpoint(sent_contacts: list):
+                # Guardar el último CardCode tras cada lote aceptado por StaffKit
+                advance_watermark(state, sent_contacts)
+                if args.bot_id:
+                    save_state(args.bot_id, state)
             
-            # Guardar estado
-            state['total_synced'] = state.get('total_synced', 0) + result['saved']
-            if args.bot_id:
-                save_state(args.bot_id, state)
+            result = {'saved': 0}
+            try:
+                result = send_to_staffkit(all_contacts, config['list_id'], args.api_key,
+                                          on_chunk=checkpoint)
+                
+                logger.info(f"  Guardados: {result['saved']}")
+                logger.info(f"  Duplicados: {result['duplicates']}")
+            finally:
+                # Guardar estado (también si se interrumpe a mitad del envío)
+                state['total_synced'] = state.get('total_synced', 0) + result['saved']
+                if args.bot_id:
+                    save_state(args.bot_id, state)
         else:
             logger.warning("No se especificó list_id o api_key, no se enviarán los datos")
         
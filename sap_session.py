@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Caché en disco de la cookie de sesión del Service Layer para los scripts de test.
+
+Evita un /Login por ejecución: la cookie (B1SESSION/ROUTEID) se guarda en
+~/.botscrap/sap_session.json y se reutiliza mientras SAP la acepte.
+
+Uso:
+    session = requests.Session()
+    if not ensure_login(session, SAP_URL, COMPANY, USER, PASSWORD):
+        exit(1)
+"""
+
+import json
+import os
+import time
+from typing import Dict, Optional
+
+# HTTP/2 (opcional): varias peticiones concurrentes sobre una sola conexión TLS
+try:
+    import h2  # noqa: F401  (lo usa httpx para http2=True)
+    import httpx
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+SESSION_FILE = os.path.expanduser('~/.botscrap/sap_session.json')
+SESSION_TTL = 25 * 60  # SL caduca a los 30 min de inactividad
+
+
+def load_session(sap_url: str = None, company: str = None) -> Optional[Dict]:
+    """Cookies guardadas si no han caducado (y son del mismo servidor/CompanyDB)"""
+    try:
+        with open(SESSION_FILE, 'r') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if saved.get('expires_at', 0) <= time.time():
+        return None
+    if (sap_url and saved.get('sap_url') != sap_url) or (company and saved.get('company') != company):
+        return None
+    return saved.get('cookies') or None
+
+
+def save_session(cookies: Dict, expires_at: float, sap_url: str = None, company: str = None):
+    """Guardar las cookies (fichero 0600: la cookie da acceso a SAP)"""
+    data = {'sap_url': sap_url, 'company': company, 'cookies': cookies, 'expires_at': expires_at}
+    tmp_file = SESSION_FILE + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(SESSION_FILE), exist_ok=True)
+        fd = os.open(tmp_file, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, SESSION_FILE)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar la sesión SAP: {e}")
+
+
+def http2_client(headers: Dict = None, timeout: int = 30):
+    """
+    Cliente httpx con HTTP/2 (si el servidor lo negocia) o None si falta httpx/h2.
+    Misma API get/post que requests.Session para los scripts.
+    """
+    if not HAS_HTTP2:
+        return None
+    return httpx.Client(
+        transport=httpx.HTTPTransport(http2=True, verify=False, retries=3),
+        headers=headers,
+        timeout=timeout
+    )
+
+
+def ensure_login(session, sap_url: str, company: str, user: str, password: str,
+                 timeout: int = 30) -> bool:
+    """
+    Dejar `session` autenticada: reutiliza la cookie guardada si SAP la acepta,
+    si no (o si responde 401) hace /Login y guarda la nueva cookie.
+    """
+    cookies = load_session(sap_url, company)
+    if cookies:
+        session.cookies.update(cookies)
+        try:
+            r = session.get(f"{sap_url}/BusinessPartners/$count", params={'$top': 0}, timeout=timeout)
+            if r.status_code == 200:
+                # Renovar la caducidad: SL cuenta desde la última petición
+                save_session(cookies, time.time() + SESSION_TTL, sap_url, company)
+                return True
+        except Exception:
+            pass
+        session.cookies.clear()
+
+    r = session.post(f"{sap_url}/Login", json={
+        "CompanyDB": company,
+        "UserName": user,
+        "Password": password
+    }, timeout=timeout)
+    if r.status_code != 200:
+        print(f"❌ Login FALLÓ: {r.status_code} - {r.text[:200]}")
+        return False
+
+    save_session(dict(session.cookies), time.time() + SESSION_TTL, sap_url, company)
+    return True
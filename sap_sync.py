@@ -23,10 +23,16 @@ import logging
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
 
 import pymssql
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from json_utils import chunks as _chunks, json_body as _json_body, json_loads, json_pretty
 
 # ============================================================================
 # CONFIGURACIÓN
@@ -34,14 +40,32 @@ import requests
 
 STATE_DIR = '/var/www/vhosts/territoriodrasanvicr.com/b/sync_state'
 STAFFKIT_URL = 'https://staff.replanta.dev'
+STAFFKIT_BULK_SIZE = 200  # Contactos por petición a sync_sap_lead_bulk
+STAFFKIT_MAX_WORKERS = 10  # POSTs simultáneos a StaffKit si no hay endpoint bulk
+SAP_FETCH_SIZE = 500  # Filas por fetchmany al leer OCRD
 
 # Dominios de email genéricos (no corporativos)
-GENERIC_DOMAINS = {
+GENERIC_DOMAINS = frozenset({
     'gmail.com', 'hotmail.com', 'hotmail.es', 'outlook.com', 'outlook.es',
     'yahoo.com', 'yahoo.es', 'live.com', 'msn.com', 'icloud.com',
     'protonmail.com', 'mail.com', 'aol.com', 'zoho.com',
     'telefonica.net', 'orange.es', 'vodafone.es', 'movistar.es'
-}
+})
+
+# Sesión HTTP compartida para StaffKit: reutiliza conexiones TCP/TLS entre llamadas
+_STAFFKIT = requests.Session()
+_STAFFKIT.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+_STAFFKIT.headers.update({'User-Agent': 'BotScrap-External/1.0'})
+
+# Separadores cuando un campo de email trae varias direcciones
+_EMAIL_SPLIT = re.compile(r'[;,\s]+')
+
+# Estado por bot ya leído/escrito en este proceso
+_state_cache = {}
 
 # Logging
 logging.basicConfig(
@@ -51,17 +75,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Directorio de estado: se crea una sola vez al importar
+try:
+    os.makedirs(STATE_DIR, exist_ok=True)
+except PermissionError as e:
+    logger.warning(f"No se pudo crear {STATE_DIR}: {e}")
+
 
 # ============================================================================
 # FUNCIONES AUXILIARES
 # ============================================================================
 
 def is_corporate_email(email: str) -> bool:
-    """Verifica si es email corporativo"""
-    if not email or '@' not in email:
-        return False
-    domain = email.lower().split('@')[1]
-    return domain not in GENERIC_DOMAINS
+    """Verifica si es email corporativo (espera el email ya en minúsculas, de clean_email)"""
+    at = email.rfind('@') if email else -1
+    return at > 0 and email[at + 1:] not in GENERIC_DOMAINS
 
 
 def clean_email(email: str) -> str:
@@ -69,40 +97,55 @@ def clean_email(email: str) -> str:
     if not email:
         return ''
     # Si hay múltiples emails separados por ; o ,
-    emails = re.split(r'[;,\s]+', str(email))
-    for e in emails:
+    for e in _EMAIL_SPLIT.split(str(email)):
         e = e.strip().lower()
-        if '@' in e and '.' in e.split('@')[1]:
+        at = e.find('@')
+        if at > 0 and e.find('.', at + 1) > at:
             return e
     return ''
 
 
 def load_state(bot_id: int) -> dict:
-    """Carga estado del bot"""
-    os.makedirs(STATE_DIR, exist_ok=True)
+    """Carga estado del bot (se lee de disco una vez por proceso)"""
+    if bot_id in _state_cache:
+        return dict(_state_cache[bot_id])
     state_file = os.path.join(STATE_DIR, f'sap_bot_{bot_id}.json')
     if os.path.exists(state_file):
         try:
             with open(state_file, 'r') as f:
-                return json.load(f)
+                _state_cache[bot_id] = json_loads(f.read())
+                return dict(_state_cache[bot_id])
         except:
             pass
     return {'last_cardcode': '', 'last_sync': None, 'total_synced': 0}
 
 
 def save_state(bot_id: int, state: dict):
-    """Guarda estado del bot"""
-    os.makedirs(STATE_DIR, exist_ok=True)
+    """Guarda estado del bot (escritura atómica: tmp + os.replace)"""
     state_file = os.path.join(STATE_DIR, f'sap_bot_{bot_id}.json')
+    tmp_file = state_file + '.tmp'
     state['last_sync'] = datetime.now().isoformat()
-    with open(state_file, 'w') as f:
-        json.dump(state, f, indent=2)
+    with open(tmp_file, 'w') as f:
+        f.write(json_pretty(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, state_file)
+    _state_cache[bot_id] = dict(state)
 
 
 # ============================================================================
 # SAP EXTRACTION
 # ============================================================================
 
+def _iter_rows(cursor, size: int):
+    """Recorre el resultado del cursor en bloques de `size` filas"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
 def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
     """
     Extrae contactos de SAP Business One.
@@ -145,25 +188,25 @@ def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
         logger.info("Conectado a SAP")
         
         # Construir query - Usa JOIN con _WEB_Clientes que tiene el Branch
+        # Todos los valores van como parámetros (%s), nunca interpolados
         where_clauses = ["o.E_Mail IS NOT NULL", "o.E_Mail != ''"]
+        params = [limit]
         
         # Filtrar por CardType (C=Customer, S=Supplier, L=Lead)
         if card_types:
             card_types_upper = [t.upper() for t in card_types]
-            if len(card_types_upper) == 1:
-                where_clauses.append(f"o.CardType = '{card_types_upper[0]}'")
-            else:
-                card_types_str = "', '".join(card_types_upper)
-                where_clauses.append(f"o.CardType IN ('{card_types_str}')")
+            where_clauses.append(f"o.CardType IN ({', '.join(['%s'] * len(card_types_upper))})")
+            params.extend(card_types_upper)
         
         # Filtrar por Branch si se especifica (Branch está en _WEB_Clientes)
         if branches:
-            branch_list = "', '".join(branches)
-            where_clauses.append(f"w.Branch IN ('{branch_list}')")
+            where_clauses.append(f"w.Branch IN ({', '.join(['%s'] * len(branches))})")
+            params.extend(branches)
         
         # Solo registros nuevos (CardCode > último procesado)
         if last_cardcode:
-            where_clauses.append(f"o.CardCode > '{last_cardcode}'")
+            where_clauses.append("o.CardCode > %s")
+            params.append(last_cardcode)
         
         where_sql = " AND ".join(where_clauses)
         
@@ -171,7 +214,7 @@ def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
         # Website: solo IntrntSite (U_DRA_Web es flag Y/N, NTSWebSite es smallint)
         # CardFName = nombre comercial (ej: "FARMACIA X"), CardName = propietario
         query = f"""
-            SELECT TOP {limit}
+            SELECT TOP (%s)
                 o.CardCode,
                 o.CardFName AS CompanyName,
                 o.CardName AS ContactName,
@@ -191,13 +234,14 @@ def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
         """
         
         logger.info(f"Ejecutando query (branches={branches}, desde={last_cardcode or 'inicio'})...")
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        logger.info(f"Obtenidos {len(rows)} registros de SAP")
+        cursor.arraysize = SAP_FETCH_SIZE
+        cursor.execute(query, tuple(params))
         
-        # Procesar y filtrar
+        # Procesar y filtrar a medida que llegan las filas (sin fetchall)
         contacts = []
-        for row in rows:
+        total_rows = 0
+        for row in _iter_rows(cursor, SAP_FETCH_SIZE):
+            total_rows += 1
             email = clean_email(row.get('Email', ''))
             website_from_sap = (row.get('Website') or '').strip()
             is_corporate = is_corporate_email(email)
@@ -249,6 +293,7 @@ def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
                 'website': website
             })
         
+        logger.info(f"Obtenidos {total_rows} registros de SAP")
         logger.info(f"Filtrados a {len(contacts)} emails corporativos")
         
         cursor.close()
@@ -266,12 +311,107 @@ def extract_from_sap(config: dict, last_cardcode: str = '') -> list:
 # STAFFKIT API
 # ============================================================================
 
-def sync_to_staffkit(api_key: str, list_id: int, contacts: list) -> dict:
+def _lead_data(contact: dict) -> dict:
+    """Campos SAP de un contacto tal como los espera sync_sap_lead"""
+    return {
+        'cardcode': contact['cardcode'],
+        'email': contact['email'],
+        'company': contact['company'],
+        'name': contact.get('name', ''),
+        'phone': contact['phone'],
+        'city': contact['city'],
+        'country': contact['country'],
+        'website': contact.get('website', ''),
+        'branch': contact['branch']
+    }
+
+
+def _count_status(stats: dict, contact: dict, result: dict):
+    """Acumula en stats el resultado de sincronizar un contacto"""
+    if result.get('success'):
+        status = result.get('status', 'unknown')
+        if status == 'created':
+            stats['created'] += 1
+        elif status == 'updated':
+            stats['updated'] += 1
+            changes = result.get('changes', {})
+            if changes:
+                logger.info(f"  Actualizado {contact['cardcode']}: {list(changes.keys())}")
+        elif status == 'unchanged':
+            stats['unchanged'] += 1
+    else:
+        stats['errors'] += 1
+        logger.warning(f"Error: {contact['cardcode']} - {result.get('error', 'Unknown')}")
+
+
+def sync_to_staffkit_bulk(api_key: str, list_id: int, contacts: list,
+                          batch_size: int = STAFFKIT_BULK_SIZE) -> Optional[dict]:
+    """
+    Sincroniza contactos en lotes (una petición por lote) con sync_sap_lead_bulk.
+    
+    Petición: POST bots.php?action=sync_sap_lead_bulk con
+    {'api_key', 'list_id', 'contacts': [...]}; respuesta {'results': [...]} con
+    un {'success', 'status': created|updated|unchanged, 'error'} por contacto.
+    
+    Returns:
+        Mismo formato que sync_to_staffkit, o None si StaffKit no tiene
+        el endpoint bulk (404/501, 400 o acción desconocida) y hay que
+        sincronizar uno a uno.
+    """
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+    sent = 0
+    
+    for chunk in _chunks(contacts, batch_size):
+        try:
+            resp = _STAFFKIT.post(
+                f"{STAFFKIT_URL}/api/bots.php",
+                params={'action': 'sync_sap_lead_bulk'},
+                json={
+                    'api_key': api_key,
+                    'list_id': list_id,
+                    'contacts': [_lead_data(c) for c in chunk]
+                },
+                timeout=60
+            )
+        except Exception as e:
+            stats['errors'] += len(chunk)
+            sent += len(chunk)
+            logger.error(f"Error sincronizando lote de {len(chunk)} contactos: {e}")
+            continue
+        
+        try:
+            results = _json_body(resp).get('results') if resp.status_code == 200 else None
+        except ValueError:
+            results = None
+        
+        if isinstance(results, list) and len(results) == len(chunk):
+            for contact, result in zip(chunk, results):
+                _count_status(stats, contact, result)
+        elif resp.status_code in (200, 400, 404, 501):
+            # Sin endpoint bulk (o respuesta sin resultados por contacto)
+            if not sent:
+                return None
+            # Ya se enviaron lotes: sincronizar el resto uno a uno
+            logger.warning("Endpoint bulk dejó de responder, sincronizando el resto uno a uno")
+            rest = sync_to_staffkit(api_key, list_id, contacts[sent:], bulk=False)
+            return {k: stats[k] + rest[k] for k in stats}
+        else:
+            stats['errors'] += len(chunk)
+            logger.warning(f"Error en lote: HTTP {resp.status_code} - {resp.text[:200]}")
+        
+        sent += len(chunk)
+        logger.info(f"  Lote sincronizado: {sent}/{len(contacts)} contactos")
+    
+    return stats
+
+
+def sync_to_staffkit(api_key: str, list_id: int, contacts: list, bulk: bool = True) -> dict:
     """
     Sincroniza contactos a StaffKit de forma inteligente.
     - Nuevos: los crea
     - Existentes: solo actualiza campos SAP si cambiaron
     - Nunca toca campos enriquecidos (ai_*, email_confianza, etc.)
+    - Usa el endpoint bulk si existe; si no, un POST por contacto
     
     Returns:
         {'created': N, 'updated': N, 'unchanged': N, 'errors': N}
@@ -279,61 +419,43 @@ def sync_to_staffkit(api_key: str, list_id: int, contacts: list) -> dict:
     if not contacts:
         return {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
     
+    logger.info(f"Sincronizando {len(contacts)} contactos a StaffKit (lista {list_id})...")
+    
+    if bulk:
+        stats = sync_to_staffkit_bulk(api_key, list_id, contacts)
+        if stats is not None:
+            logger.info(f"Completado: {stats['created']} nuevos, {stats['updated']} actualizados, {stats['unchanged']} sin cambios, {stats['errors']} errores")
+            return stats
+        logger.info("StaffKit sin endpoint bulk, sincronizando uno a uno")
+    
     headers = {
         'Authorization': f'Bearer {api_key}',
         'Content-Type': 'application/json'
     }
     
-    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
-    
-    logger.info(f"Sincronizando {len(contacts)} contactos a StaffKit (lista {list_id})...")
-    
-    for contact in contacts:
-        lead_data = {
-            'cardcode': contact['cardcode'],
-            'email': contact['email'],
-            'company': contact['company'],
-            'name': contact.get('name', ''),
-            'phone': contact['phone'],
-            'city': contact['city'],
-            'country': contact['country'],
-            'website': contact.get('website', ''),
-            'branch': contact['branch']
-        }
-        
+    def sync_one(contact: dict) -> dict:
         payload = {
             'action': 'sync_sap_lead',
             'list_id': list_id,
-            'lead_data': json.dumps(lead_data)
+            'lead_data': json.dumps(_lead_data(contact))
         }
-        
         try:
-            resp = requests.post(
+            resp = _STAFFKIT.post(
                 f"{STAFFKIT_URL}/api/bots.php",
                 json=payload,
                 headers=headers,
                 timeout=10
             )
-            result = resp.json()
-            
-            if result.get('success'):
-                status = result.get('status', 'unknown')
-                if status == 'created':
-                    stats['created'] += 1
-                elif status == 'updated':
-                    stats['updated'] += 1
-                    changes = result.get('changes', {})
-                    if changes:
-                        logger.info(f"  Actualizado {contact['cardcode']}: {list(changes.keys())}")
-                elif status == 'unchanged':
-                    stats['unchanged'] += 1
-            else:
-                stats['errors'] += 1
-                logger.warning(f"Error: {contact['cardcode']} - {result.get('error', 'Unknown')}")
-                
+            return _json_body(resp)
         except Exception as e:
-            stats['errors'] += 1
-            logger.error(f"Error sincronizando {contact['cardcode']}: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+    
+    # Un POST por contacto, varios en paralelo; los resultados llegan en orden
+    with ThreadPoolExecutor(max_workers=STAFFKIT_MAX_WORKERS) as executor:
+        for contact, result in zip(contacts, executor.map(sync_one, contacts)):
+            _count_status(stats, contact, result)
     
     logger.info(f"Completado: {stats['created']} nuevos, {stats['updated']} actualizados, {stats['unchanged']} sin cambios, {stats['errors']} errores")
     return stats
@@ -354,14 +476,14 @@ def get_bot_config(api_key: str, bot_id: int) -> dict:
     """Obtiene configuración del bot desde StaffKit"""
     try:
         headers = {'Authorization': f'Bearer {api_key}'}
-        resp = requests.get(
+        resp = _STAFFKIT.get(
             f"{STAFFKIT_URL}/api/v2/external-bot",
             params={'id': bot_id},
             headers=headers,
             timeout=10
         )
         if resp.ok:
-            data = resp.json()
+            data = _json_body(resp)
             bot = data.get('bot', {})
             return {
                 'server': bot.get('config_sap_server', ''),
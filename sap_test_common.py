@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Base común de los scripts de test de SAP Service Layer (test_sap_*.py)
+
+Config de conexión, sesión HTTP (pool, reintentos, gzip) y login con la
+cookie cacheada de sap_session. Cada script expone run(session):
+
+    with sap_session() as session:
+        run(session)
+
+Todos los tests con un solo arranque de Python y un solo login:
+    python -m sap_tests
+"""
+
+from contextlib import contextmanager
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from sap_session import ensure_login, http2_client
+from json_utils import json_body as jloads  # noqa: F401  (re-export para los test_sap_*.py)
+
+# Desactivar warnings SSL (el SL usa certificado self-signed)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Config
+SAP_URL = "https://verdis.artesap.com:50000/b1s/v1"
+COMPANY = "CLOUD_VERDIS_ES"
+USER = "manager"
+PASSWORD = "9006"
+
+# Respuestas comprimidas y sin anotaciones OData por entidad
+SESSION_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "Prefer": "odata.metadata=minimal"
+}
+
+
+def make_session(http2: bool = True):
+    """
+    Sesión HTTP para el SL: HTTP/2 si hay httpx+h2 (las consultas concurrentes
+    van por una sola conexión); si no, o con http2=False, requests con pool y reintentos
+    """
+    session = http2_client(SESSION_HEADERS) if http2 else None
+    if session is not None:
+        return session
+
+    session = requests.Session()
+    session.verify = False
+    session.headers.update(SESSION_HEADERS)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        # Reintenta timeouts, cortes y 429/5xx con backoff exponencial
+        # respetando Retry-After; 400/401 no se reintentan
+        max_retries=Retry(
+            total=3,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False  # Agotados los reintentos, devolver la última respuesta
+        )
+    ))
+    return session
+
+
+@contextmanager
+def sap_session(http2: bool = True):
+    """
+    Sesión autenticada en el SL. Sin Logout al salir: la cookie queda
+    guardada para la siguiente ejecución (ver sap_session.ensure_login)
+    """
+    session = make_session(http2)
+    try:
+        if not ensure_login(session, SAP_URL, COMPANY, USER, PASSWORD):
+            raise SystemExit("❌ No se pudo iniciar sesión en SAP")
+        yield session
+    finally:
+        session.close()
+
+
+def count(session, filter_str: str = None) -> str:
+    """Resultado (texto) de BusinessPartners/$count con un $filter opcional"""
+    params = {'$filter': filter_str} if filter_str else None
+    return session.get(f"{SAP_URL}/BusinessPartners/$count", params=params, timeout=30).text
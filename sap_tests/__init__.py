@@ -0,0 +1 @@
+# Tests de SAP Service Layer en un solo proceso: python -m sap_tests
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Ejecutar todos los tests de SAP con un solo arranque de Python y un solo login
+
+Uso (desde la raíz del repo):
+    python -m sap_tests
+"""
+
+import test_sap_connection
+import test_sap_count
+import test_sap_filter
+import test_sap_verdis
+from sap_test_common import sap_session
+
+
+def main():
+    with sap_session() as session:
+        for module in (test_sap_connection, test_sap_filter, test_sap_count):
+            module.run(session)
+    
+    # test_sap_verdis lee respuestas en streaming (response.raw): sesión requests,
+    # que reutiliza la cookie guardada del login anterior sin volver a hacer /Login
+    with sap_session(http2=False) as session:
+        test_sap_verdis.run(session)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,20 +4,67 @@ StaffKit API Client
 Cliente para comunicación con StaffKit desde VPS externo
 """
 
+import asyncio
+import math
 import os
+import random
 import re
 import time
-import json
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import List, Dict, Set, Optional
-from urllib.parse import urlparse
+from urllib.parse import quote_plus, urlencode, urlparse
 
 import requests
-from tenacity import retry, stop_after_attempt, wait_exponential
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from json_utils import chunks as _chunks, json_body as _json_body, json_bytes as _json_bytes
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
 
 logger = logging.getLogger(__name__)
 
+CHECK_BATCH_SIZE = int(os.getenv('STAFFKIT_BATCH_CHUNK', '100'))  # Dominios por petición a /api/v2/check-duplicate (límite del API: 100)
+CHECK_MAX_WORKERS = 8  # Lotes de check-duplicate enviados en paralelo
+SAVE_LEADS_BULK_SIZE = 200  # Leads por petición a save_leads_bulk (post_max_size de PHP)
+DUP_CACHE_MAX = 50000  # Dominios máximos en la caché de check-duplicate
+ASYNC_MAX_CONNECTIONS = 50  # Conexiones del cliente async (y peticiones simultáneas de save_leads_many)
+CONNECT_TIMEOUT = float(os.getenv('STAFFKIT_CONNECT_TIMEOUT', '3'))  # Segundos para abrir la conexión
+
+
+class _JitterRetry(Retry):
+    """
+    Retry de urllib3 con backoff exponencial y jitter completo (uniforme entre 0
+    y el backoff), acotado a STAFFKIT_MAX_BACKOFF segundos, para que los bots no
+    reintenten todos a la vez cuando StaffKit devuelve 5xx.
+    """
+    
+    MAX_BACKOFF = float(os.getenv('STAFFKIT_MAX_BACKOFF', '8'))
+    
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, min(backoff, self.MAX_BACKOFF)) if backoff else 0
+
+
+def _timeout(name: str, read: float, connect: float = None) -> tuple:
+    """(connect, read) de un endpoint; STAFFKIT_TIMEOUT_<name> sobreescribe el read"""
+    return (connect or CONNECT_TIMEOUT, float(os.getenv(f'STAFFKIT_TIMEOUT_{name}', read)))
+
 
+# Protocolo y www. opcionales; captura el host solo si tiene forma de dominio
+# (etiquetas alfanuméricas separadas por puntos, admite IDN como 'españa.es')
+_NORMALIZE_RE = re.compile(r'^(?:https?://)?(?:www\.)?([^\W_][\w\-]*(?:\.[^\W_][\w\-]*)+)', re.IGNORECASE)
+_NORMALIZE_MATCH = _NORMALIZE_RE.match
+
+
+@lru_cache(maxsize=4096)
 def normalize_domain(url: str) -> str:
     """
     Normalizar URL/dominio para comparaciones consistentes.
@@ -32,24 +79,248 @@ def normalize_domain(url: str) -> str:
     if not url:
         return ''
     
-    url = url.lower().strip()
-    # Quitar protocolo
-    url = re.sub(r'^https?://', '', url)
-    # Quitar www.
-    url = re.sub(r'^www\.', '', url)
-    # Quitar trailing slash
-    url = url.rstrip('/')
-    # Quedarse solo con el dominio (sin path)
-    url = url.split('/')[0]
-    # Quitar puerto si existe
-    url = url.split(':')[0]
+    m = _NORMALIZE_MATCH(url.strip())
+    return m.group(1).lower() if m else ''
+
+
+def _raw_host(url: str) -> str:
+    """Prefijo esquema+host de una URL sin normalizar (hasta el primer / tras el esquema)"""
+    url = url.strip() if url else ''
+    scheme_end = url.find('://')
+    path_start = url.find('/', scheme_end + 3 if scheme_end >= 0 else 0)
+    return url if path_start < 0 else url[:path_start]
+
+
+def _group_by_normalized(domains: List[str]) -> Dict[str, List[str]]:
+    """Agrupar dominios originales por su forma normalizada (descarta los vacíos)"""
+    # Caso frecuente: todas las URLs son del mismo host -> normalizar una sola vez
+    first_host = _raw_host(domains[0])
+    if all(_raw_host(d) == first_host for d in domains):
+        normalized = normalize_domain(domains[0])
+        return {normalized: list(domains)} if normalized else {}
+    
+    normalized_map = {}  # {normalized: [originals]}
+    
+    for domain in domains:
+        normalized = normalize_domain(domain)
+        if normalized:
+            normalized_map.setdefault(normalized, []).append(domain)
+    
+    return normalized_map
+
+
+class _DuplicateCache:
+    """Resultados de check-duplicate con TTL, acotada por LRU. ttl=0 la desactiva."""
+    
+    def __init__(self, ttl: int, max_size: int = DUP_CACHE_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()  # {normalized: (timestamp, exists)}
+    
+    def get(self, domain: str) -> Optional[bool]:
+        """Resultado cacheado y vigente, o None"""
+        if not self.ttl:
+            return None
+        entry = self._data.get(domain)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= self.ttl:
+            del self._data[domain]
+            return None
+        self._data.move_to_end(domain)
+        return entry[1]
+    
+    def put(self, domain: str, exists: bool):
+        if not self.ttl:
+            return
+        self._data[domain] = (time.time(), exists)
+        self._data.move_to_end(domain)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def mark_saved(self, lead_data: Dict, result: Dict):
+        """Tras guardar (saved o duplicate) el dominio ya existe: evita un False cacheado obsoleto"""
+        if result.get('success') or result.get('status') == 'duplicate':
+            domain = normalize_domain(lead_data.get('website') or '')
+            if domain:
+                self.put(domain, True)
+    
+    def split(self, normalized: List[str]):
+        """Separar en ({dominio: exists} cacheados, [pendientes de consultar])"""
+        hits = {}
+        misses = []
+        for domain in normalized:
+            exists = self.get(domain)
+            if exists is None:
+                misses.append(domain)
+            else:
+                hits[domain] = exists
+        return hits, misses
+
+
+def _map_duplicate_results(domains: List[str], normalized_map: Dict[str, List[str]],
+                           responses: list, hits: Dict[str, bool],
+                           cache: _DuplicateCache) -> Dict[str, bool]:
+    """
+    Unir las respuestas de los lotes y los aciertos de caché (`hits`) y
+    devolver {original_domain: is_duplicate}. Las respuestas se guardan en `cache`.
+    """
+    all_results = {}
+    total_duplicates = 0
+    total_new = 0
+    
+    for response in responses:
+        if response is None:
+            continue  # Lote fallido: sus dominios quedan como no duplicados
+        if response.status_code == 200:
+            data = _json_body(response)
+            chunk_results = data.get('results', {})
+            all_results.update(chunk_results)
+            
+            total_duplicates += data.get('duplicates_count', 0)
+            total_new += data.get('new_count', 0)
+        else:
+            logger.warning(f"StaffKit batch API error: {response.status_code}")
+    
+    logger.info(f"📊 StaffKit check: {total_duplicates} duplicates, {total_new} new ({len(normalized_map)} domains in {len(responses)} batches)")
+    
+    # Mapear resultados de vuelta a dominios originales (una vez por normalizado)
+    _get = all_results.get
+    output = {
+        original: exists
+        for normalized, originals in normalized_map.items()
+        for exists in (hits[normalized] if normalized in hits
+                       else _get(normalized, {}).get('exists', False),)
+        for original in originals
+    }
+    
+    for normalized, result in all_results.items():
+        cache.put(normalized, bool(result.get('exists', False)))
+    
+    # Incluir dominios que no se pudieron normalizar
+    for domain in domains:
+        output.setdefault(domain, False)
+    
+    return output
+
+
+# Campos de lead para StaffKit: (campo destino, claves origen por prioridad, defecto)
+_LEAD_FIELDS = (
+    ('email', ('email',), ''),
+    ('name', ('contacto', 'name'), ''),
+    ('company', ('empresa', 'company'), ''),
+    ('website', ('web', 'website'), ''),
+    ('phone', ('telefono', 'phone'), ''),
+    ('country', ('pais', 'country'), ''),
+    ('city', ('ciudad', 'city'), ''),
+    ('sector', ('sector',), ''),
+    ('org_type', ('tipo_org', 'org_type'), ''),
+    ('eco_profile', ('perfil_eco', 'eco_profile'), ''),
+    ('priority', ('prioridad', 'priority'), ''),
+    ('score', ('puntuacion', 'score'), 0),
+    ('co2_visit', ('co2_visita', 'co2_visit'), None),
+    ('annual_emissions', ('emisiones_anuales', 'annual_emissions'), None),
+    ('linkedin', ('linkedin',), ''),
+    ('notes', ('notas', 'notes'), ''),
+    ('wp_version', ('wp_version',), ''),
+    ('plugins', ('plugins',), ''),
+    ('hosting', ('hosting',), ''),
+    ('load_time', ('load_time',), None),
+    ('page_weight', ('page_weight',), None),
+    ('report_url', ('report_url',), None),
+    # Flags
+    ('needs_email_enrichment', ('needs_email_enrichment',), False),
+)
+
+
+# Parte fija del cuerpo de save_lead, codificada una sola vez
+_SAVE_LEAD_PREFIX = urlencode({'action': 'save_lead'}).encode() + b'&'
+_FORM_CONTENT_TYPE = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def _map_lead(lead: Dict) -> Dict:
+    """
+    Mapear un lead del bot a los campos de StaffKit. Se usa la primera clave
+    origen con valor (no None ni ''); si ninguna lo tiene, el valor por defecto.
+    """
+    get = lead.get
+    lead_data = {}
+    for key, sources, default in _LEAD_FIELDS:
+        for src in sources:
+            value = get(src)
+            if value is not None and value != '':
+                lead_data[key] = value
+                break
+        else:
+            lead_data[key] = default
+    return lead_data
+
+
+def _save_lead_body(lead_data: Dict, list_id: int, bot_id: int = None, run_id: int = None) -> bytes:
+    """Cuerpo form-urlencoded de save_lead: prefijo fijo + ids + lead_data"""
+    return (
+        _SAVE_LEAD_PREFIX
+        + urlencode({'list_id': list_id, 'bot_id': bot_id or 0, 'run_id': run_id or 0}).encode()
+        + b'&lead_data=' + quote_plus(_json_bytes(lead_data)).encode()
+    )
+
+
+def _save_lead_result(response, lead_data: Dict) -> Dict:
+    """Interpretar la respuesta de save_lead (requests o httpx)"""
+    if response.status_code != 200:
+        return {'success': False, 'status': 'error', 'error': f'HTTP {response.status_code}'}
+    
+    result = _json_body(response)
+    if result.get('success'):
+        logger.info(f"✅ Lead saved: {lead_data.get('website')} ({result.get('status')})")
+        return result
     
-    return url
+    logger.warning(f"StaffKit save error: {result.get('error')}")
+    return {'success': False, 'status': 'error', 'error': result.get('error')}
+
+
+def _progress_data(run_id: int, leads_found: int, leads_saved: int, leads_duplicates: int,
+                   status: str = None, error: str = None, current_action: str = None) -> Dict:
+    """Form-data de update_progress"""
+    data = {
+        'action': 'update_progress',
+        'run_id': run_id,
+        'leads_found': leads_found,
+        'leads_saved': leads_saved,
+        'leads_duplicates': leads_duplicates,
+    }
+    
+    if status:
+        data['status'] = status
+    if error:
+        data['last_error'] = error
+    if current_action:
+        data['current_action'] = current_action
+    
+    return data
+
+
+def _httpx_client(limits: 'httpx.Limits' = None, **options) -> 'httpx.AsyncClient':
+    """
+    httpx.AsyncClient con HTTP/2 si está instalado h2 (httpx[http2]). El transport
+    reintenta los fallos de conexión (STAFFKIT_RETRIES intentos en total, como la
+    sesión síncrona); con transport propio los límites del pool van en él.
+    """
+    retries = max(int(os.getenv('STAFFKIT_RETRIES', '3')) - 1, 0)
+    limits = limits or httpx.Limits()
+    try:
+        transport = httpx.AsyncHTTPTransport(http2=True, retries=retries, limits=limits)
+    except ImportError:
+        transport = httpx.AsyncHTTPTransport(retries=retries, limits=limits)
+    return httpx.AsyncClient(transport=transport, **options)
 
 
 class StaffKitClient:
     """Cliente para comunicarse con la API de StaffKit"""
     
+    __slots__ = ('api_url', 'api_key', 'timeout', 'max_retries', 'enabled', '_timeouts',
+                 '_dup_cache', '_form_hdrs', '_json_headers', '_session', '_aclient', '_aclient_loop')
+    
     def __init__(self, api_url: str = None, api_key: str = None):
         """
         Inicializar cliente
@@ -64,25 +335,81 @@ class StaffKitClient:
         self.max_retries = int(os.getenv('STAFFKIT_RETRIES', '3'))
         self.enabled = bool(self.api_url and self.api_key)
         
+        # Timeouts (connect, read) por endpoint: connect corto para fallar rápido
+        # si StaffKit no es alcanzable, read según lo que tarda cada acción en PHP
+        self._timeouts = {
+            'ping': _timeout('PING', 5),
+            'get_lists': _timeout('LISTS', 10),
+            'check_duplicate': _timeout('CHECK', 7),
+            'check_batch': _timeout('CHECK_BATCH', 15),
+            'save_lead': _timeout('SAVE', self.timeout, connect=5),
+            'update_progress': _timeout('PROGRESS', 7),
+            'complete_run': _timeout('COMPLETE', 10),
+            'send_telegram': _timeout('TELEGRAM', 10),
+        }
+        
+        # Resultados recientes de check-duplicate (STAFFKIT_DUP_TTL=0 la desactiva)
+        self._dup_cache = _DuplicateCache(int(os.getenv('STAFFKIT_DUP_TTL', '600')))
+        
+        # Headers construidos una sola vez
+        self._form_hdrs = {
+            'Authorization': f'Bearer {self.api_key}',
+            'User-Agent': 'BotScrap-External/1.0'
+        }
+        self._json_headers = {**self._form_hdrs, 'Content-Type': 'application/json'}
+        
+        # Sesión HTTP propia: keep-alive y pool de conexiones hacia StaffKit.
+        # Sin Content-Type fijo: requests lo pone según se envíe json= o data=
+        # Los reintentos (timeouts, cortes, 5xx, Retry-After) los hace urllib3
+        # dentro del adapter, con la conexión del pool ya asignada
+        # STAFFKIT_RETRIES son intentos en total (como el bucle anterior): 1 + reintentos
+        retries = _JitterRetry(
+            total=max(self.max_retries - 1, 0),
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False  # Agotados los reintentos, devolver la última respuesta
+        )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retries)
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers.update(self._form_headers())
+        
+        # Cliente httpx de check_duplicates_batch_async (se crea en el primer uso)
+        self._aclient = None
+        self._aclient_loop = None
+        
         if self.enabled:
             logger.info(f"✅ StaffKit client initialized: {self.api_url}")
         else:
             logger.warning("⚠️ StaffKit client disabled (no URL or API key)")
     
+    def close(self):
+        """Cerrar las conexiones abiertas de la sesión"""
+        self._session.close()
+    
+    async def aclose(self):
+        """Cerrar también el cliente async (desde el bucle en que se usó)"""
+        self.close()
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def _headers(self) -> Dict:
         """Headers para las peticiones"""
-        return {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json',
-            'User-Agent': 'BotScrap-External/1.0'
-        }
+        return self._json_headers
     
     def _form_headers(self) -> Dict:
         """Headers para form-data"""
-        return {
-            'Authorization': f'Bearer {self.api_key}',
-            'User-Agent': 'BotScrap-External/1.0'
-        }
+        return self._form_hdrs
     
     def test_connection(self) -> Dict:
         """
@@ -95,11 +422,10 @@ class StaffKitClient:
             return {'success': False, 'error': 'Client not configured', 'status': 'error'}
         
         try:
-            response = requests.get(
+            response = self._session.get(
                 f"{self.api_url}/api/bots.php",
                 params={'action': 'ping'},
-                headers=self._headers(),
-                timeout=10
+                timeout=self._timeouts['ping']
             )
             
             success = response.status_code == 200
@@ -128,15 +454,14 @@ class StaffKitClient:
             return []
         
         try:
-            response = requests.get(
+            response = self._session.get(
                 f"{self.api_url}/api/bots.php",
                 params={'action': 'get_lists'},
-                headers=self._headers(),
-                timeout=10
+                timeout=self._timeouts['get_lists']
             )
             
             if response.status_code == 200:
-                data = response.json()
+                data = _json_body(response)
                 if data.get('success') and 'lists' in data:
                     return data['lists']
             
@@ -166,17 +491,23 @@ class StaffKitClient:
         if not domain:
             return False
         
+        # Consultado hace poco: sin petición
+        cached = self._dup_cache.get(domain)
+        if cached is not None:
+            return cached
+        
         try:
-            response = requests.get(
+            response = self._session.get(
                 f"{self.api_url}/api/v2/check-duplicate",
                 params={'domain': domain},
-                headers=self._headers(),
-                timeout=5
+                timeout=self._timeouts['check_duplicate']
             )
             
             if response.status_code == 200:
-                data = response.json()
-                return data.get('exists', False)
+                data = _json_body(response)
+                exists = data.get('exists', False)
+                self._dup_cache.put(domain, exists)
+                return exists
             else:
                 logger.warning(f"StaffKit API error: {response.status_code}")
                 return False
@@ -196,68 +527,101 @@ class StaffKitClient:
             Dict con {original_domain: is_duplicate}
         """
         if not self.enabled or not domains:
-            return {d: False for d in domains}
+            return dict.fromkeys(domains, False)
         
-        # Normalizar dominios y crear mapeo original -> normalizado
-        normalized_map = {}  # {normalized: [originals]}
-        original_to_normalized = {}  # {original: normalized}
+        normalized_map = _group_by_normalized(domains)
+        if not normalized_map:
+            return dict.fromkeys(domains, False)
         
-        for domain in domains:
-            normalized = normalize_domain(domain)
-            if normalized:
-                original_to_normalized[domain] = normalized
-                if normalized not in normalized_map:
-                    normalized_map[normalized] = []
-                normalized_map[normalized].append(domain)
+        # Solo se consultan los que no están en caché
+        hits, pending = self._dup_cache.split(list(normalized_map))
         
+        try:
+            if not pending:
+                responses = []
+            elif len(pending) <= CHECK_BATCH_SIZE:
+                responses = [self._post_duplicates_chunk(pending)]
+            else:
+                # Lotes en paralelo sobre la misma sesión (pool_maxsize >= workers);
+                # cada lote se envía en cuanto se genera
+                workers = min(CHECK_MAX_WORKERS, math.ceil(len(pending) / CHECK_BATCH_SIZE))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(self._post_duplicates_chunk, c)
+                               for c in _chunks(pending, CHECK_BATCH_SIZE)]
+                    responses = [f.result() for f in as_completed(futures)]
+            
+            return _map_duplicate_results(domains, normalized_map, responses, hits, self._dup_cache)
+                
+        except Exception as e:
+            logger.warning(f"StaffKit batch check failed: {e}")
+            return dict.fromkeys(domains, False)
+    
+    async def check_duplicates_batch_async(self, domains: List[str]) -> Dict[str, bool]:
+        """
+        Versión async de check_duplicates_batch: todos los lotes con asyncio.gather
+        sobre un httpx.AsyncClient (HTTP/2 si está instalado h2).
+        Sin httpx, ejecuta la versión síncrona en un hilo.
+        """
+        if not HAS_HTTPX:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.check_duplicates_batch, domains)
+        
+        if not self.enabled or not domains:
+            return dict.fromkeys(domains, False)
+        
+        normalized_map = _group_by_normalized(domains)
         if not normalized_map:
-            return {d: False for d in domains}
+            return dict.fromkeys(domains, False)
         
-        # Chunkar en lotes de 100 (límite del API)
-        BATCH_SIZE = 100
-        all_normalized = list(normalized_map.keys())
-        all_results = {}
-        total_duplicates = 0
-        total_new = 0
+        url = f"{self.api_url}/api/v2/check-duplicate"
+        hits, pending = self._dup_cache.split(list(normalized_map))
         
         try:
-            for i in range(0, len(all_normalized), BATCH_SIZE):
-                chunk = all_normalized[i:i + BATCH_SIZE]
-                
-                response = requests.post(
-                    f"{self.api_url}/api/v2/check-duplicate",
-                    json={'domains': chunk},
-                    headers=self._headers(),
-                    timeout=15
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    chunk_results = data.get('results', {})
-                    all_results.update(chunk_results)
-                    
-                    total_duplicates += data.get('duplicates_count', 0)
-                    total_new += data.get('new_count', 0)
-                else:
-                    logger.warning(f"StaffKit batch API error: {response.status_code} (chunk {i//BATCH_SIZE + 1})")
+            client = self._async_client()
+            responses = await asyncio.gather(*[
+                client.post(url, content=_json_bytes({'domains': c}))
+                for c in _chunks(pending, CHECK_BATCH_SIZE)
+            ], return_exceptions=True)
             
-            logger.info(f"📊 StaffKit check: {total_duplicates} duplicates, {total_new} new ({len(all_normalized)} domains in {(len(all_normalized)-1)//BATCH_SIZE + 1} batches)")
+            for response in responses:
+                if isinstance(response, Exception):
+                    logger.warning(f"StaffKit async batch chunk failed: {response}")
+            responses = [None if isinstance(r, Exception) else r for r in responses]
             
-            # Mapear resultados de vuelta a dominios originales
-            output = {}
-            for original, normalized in original_to_normalized.items():
-                output[original] = all_results.get(normalized, {}).get('exists', False)
+            return _map_duplicate_results(domains, normalized_map, responses, hits, self._dup_cache)
             
-            # Incluir dominios que no se pudieron normalizar
-            for domain in domains:
-                if domain not in output:
-                    output[domain] = False
-            
-            return output
-                
         except Exception as e:
-            logger.warning(f"StaffKit batch check failed: {e}")
-            return {d: False for d in domains}
+            logger.warning(f"StaffKit async batch check failed: {e}")
+            return dict.fromkeys(domains, False)
+    
+    def _async_client(self) -> 'httpx.AsyncClient':
+        """
+        Cliente httpx con las mismas cabeceras que la sesión síncrona, reutilizado
+        entre llamadas (conexiones abiertas). Sus conexiones son del bucle de
+        asyncio en que se creó: con otro bucle se crea uno nuevo.
+        """
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            self._aclient = _httpx_client(
+                headers=self._headers(),
+                timeout=httpx.Timeout(self._timeouts['check_batch'][1], connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_keepalive_connections=20)
+            )
+            self._aclient_loop = loop
+        return self._aclient
+    
+    def _post_duplicates_chunk(self, chunk: List[str]) -> Optional[requests.Response]:
+        """POST de un lote a /api/v2/check-duplicate (None si falla: no tumba el resto)"""
+        try:
+            return self._session.post(
+                f"{self.api_url}/api/v2/check-duplicate",
+                data=_json_bytes({'domains': chunk}),
+                headers={'Content-Type': 'application/json'},
+                timeout=self._timeouts['check_batch']
+            )
+        except Exception as e:
+            logger.warning(f"StaffKit batch chunk failed ({len(chunk)} domains): {e}")
+            return None
     
     def save_lead(self, lead: Dict, list_id: int, bot_id: int = None, run_id: int = None) -> Dict:
         """
@@ -275,85 +639,82 @@ class StaffKitClient:
         if not self.enabled:
             return {'success': False, 'status': 'disabled'}
         
-        # Mapear campos
-        lead_data = {
-            'email': lead.get('email', ''),
-            'name': lead.get('contacto', lead.get('name', '')),
-            'company': lead.get('empresa', lead.get('company', '')),
-            'website': lead.get('web', lead.get('website', '')),
-            'phone': lead.get('telefono', lead.get('phone', '')),
-            'country': lead.get('pais', lead.get('country', '')),
-            'city': lead.get('ciudad', lead.get('city', '')),
-            'sector': lead.get('sector', ''),
-            'org_type': lead.get('tipo_org', lead.get('org_type', '')),
-            'eco_profile': lead.get('perfil_eco', lead.get('eco_profile', '')),
-            'priority': lead.get('prioridad', lead.get('priority', '')),
-            'score': lead.get('puntuacion', lead.get('score', 0)),
-            'co2_visit': lead.get('co2_visita', lead.get('co2_visit')),
-            'annual_emissions': lead.get('emisiones_anuales', lead.get('annual_emissions')),
-            'linkedin': lead.get('linkedin', ''),
-            'notes': lead.get('notas', lead.get('notes', '')),
-            'wp_version': lead.get('wp_version', ''),
-            'plugins': lead.get('plugins', ''),
-            'hosting': lead.get('hosting', ''),
-            'load_time': lead.get('load_time'),
-            'page_weight': lead.get('page_weight'),
-            'report_url': lead.get('report_url'),
-            # Flags
-            'needs_email_enrichment': lead.get('needs_email_enrichment', False),
-        }
+        lead_data = _map_lead(lead)
         
-        # Retry logic
-        last_error = None
-        backoff = 0.5
+        try:
+            response = self._post_bots(_save_lead_body(lead_data, list_id, bot_id, run_id),
+                                       self._timeouts['save_lead'])
+            result = _save_lead_result(response, lead_data)
+            self._dup_cache.mark_saved(lead_data, result)
+            return result
+            
+        except Exception as e:
+            return {'success': False, 'status': 'error', 'error': str(e)}
+    
+    def save_leads_bulk(self, leads: List[Dict], list_id: int, bot_id: int = None,
+                        run_id: int = None, batch_size: int = SAVE_LEADS_BULK_SIZE) -> List[Dict]:
+        """
+        Guardar varios leads con una petición por lote (action=save_leads_bulk)
         
-        for attempt in range(1, self.max_retries + 1):
+        Si StaffKit no tiene el endpoint (404/501 o acción desconocida), guarda
+        los leads pendientes uno a uno con save_lead.
+        
+        Returns:
+            Lista de resultados (mismo formato que save_lead), en el orden de `leads`
+        """
+        if not self.enabled:
+            return [{'success': False, 'status': 'disabled'} for _ in leads]
+        
+        results = []
+        
+        for chunk in _chunks(leads, batch_size):
+            chunk_data = [_map_lead(l) for l in chunk]
+            payload = {
+                'action': 'save_leads_bulk',
+                'list_id': list_id,
+                'bot_id': bot_id or 0,
+                'run_id': run_id or 0,
+                'leads_data': _json_bytes(chunk_data).decode()
+            }
+            
             try:
-                response = requests.post(
-                    f"{self.api_url}/api/bots.php",
-                    data={
-                        'action': 'save_lead',
-                        'list_id': list_id,
-                        'bot_id': bot_id or 0,
-                        'run_id': run_id or 0,
-                        'lead_data': json.dumps(lead_data)
-                    },
-                    headers=self._form_headers(),
-                    timeout=self.timeout
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('success'):
-                        logger.info(f"✅ Lead saved: {lead_data.get('website')} ({result.get('status')})")
-                        return result
-                    else:
-                        logger.warning(f"StaffKit save error: {result.get('error')}")
-                        return {'success': False, 'status': 'error', 'error': result.get('error')}
-                else:
-                    if 500 <= response.status_code < 600 and attempt < self.max_retries:
-                        logger.debug(f"HTTP {response.status_code}, retry {attempt}/{self.max_retries}...")
-                        time.sleep(backoff)
-                        backoff *= 2
-                        continue
-                    return {'success': False, 'status': 'error', 'error': f'HTTP {response.status_code}'}
-                    
-            except requests.Timeout as e:
-                last_error = str(e)
-                if attempt < self.max_retries:
-                    logger.debug(f"Timeout, retry {attempt}/{self.max_retries}...")
-                    time.sleep(backoff)
-                    backoff *= 2
-                    continue
-                    
+                response = self._post_bots(payload, self._timeouts['save_lead'])
+                data = _json_body(response) if response.status_code == 200 else {}
             except Exception as e:
-                last_error = str(e)
-                if attempt < self.max_retries:
-                    time.sleep(backoff)
-                    backoff *= 2
-                    continue
+                results.extend({'success': False, 'status': 'error', 'error': str(e)} for _ in chunk)
+                continue
+            
+            rows = data.get('results')
+            if response.status_code == 200 and isinstance(rows, list) and len(rows) == len(chunk):
+                for lead_data, row in zip(chunk_data, rows):
+                    self._dup_cache.mark_saved(lead_data, row)
+                results.extend(rows)
+            elif response.status_code in (200, 404, 501):
+                # Sin endpoint bulk (o respuesta sin resultados por lead): el resto uno a uno
+                logger.debug("save_leads_bulk no disponible, guardando uno a uno")
+                results.extend(self.save_lead(l, list_id, bot_id, run_id) for l in leads[len(results):])
+                return results
+            else:
+                results.extend(
+                    {'success': False, 'status': 'error', 'error': f'HTTP {response.status_code}'}
+                    for _ in chunk
+                )
         
-        return {'success': False, 'status': 'error', 'error': last_error or 'unknown error'}
+        saved = sum(1 for r in results if r.get('success'))
+        logger.info(f"✅ Leads bulk: {saved}/{len(leads)} ok")
+        return results
+    
+    def _post_bots(self, data, timeout: tuple) -> requests.Response:
+        """
+        POST form-data a /api/bots.php (los reintentos los hace el adapter de la sesión).
+        `data` puede ser un dict o el cuerpo ya codificado (bytes).
+        """
+        return self._session.post(
+            f"{self.api_url}/api/bots.php",
+            data=data,
+            headers=_FORM_CONTENT_TYPE if isinstance(data, bytes) else None,
+            timeout=timeout
+        )
     
     def update_progress(self, run_id: int, leads_found: int = 0, leads_saved: int = 0,
                        leads_duplicates: int = 0, status: str = None, error: str = None,
@@ -365,27 +726,9 @@ class StaffKitClient:
             return False
         
         try:
-            data = {
-                'action': 'update_progress',
-                'run_id': run_id,
-                'leads_found': leads_found,
-                'leads_saved': leads_saved,
-                'leads_duplicates': leads_duplicates,
-            }
-            
-            if status:
-                data['status'] = status
-            if error:
-                data['last_error'] = error
-            if current_action:
-                data['current_action'] = current_action
-            
-            response = requests.post(
-                f"{self.api_url}/api/bots.php",
-                data=data,
-                headers=self._form_headers(),
-                timeout=10
-            )
+            response = self._post_bots(_progress_data(run_id, leads_found, leads_saved, leads_duplicates,
+                                                      status, error, current_action),
+                                       self._timeouts['update_progress'])
             
             return response.status_code == 200
             
@@ -414,12 +757,7 @@ class StaffKitClient:
             if error:
                 data['error'] = error
             
-            response = requests.post(
-                f"{self.api_url}/api/bots.php",
-                data=data,
-                headers=self._form_headers(),
-                timeout=10
-            )
+            response = self._post_bots(data, self._timeouts['complete_run'])
             
             return response.status_code == 200
             
@@ -435,17 +773,145 @@ class StaffKitClient:
             return False
         
         try:
-            response = requests.post(
-                f"{self.api_url}/api/bots.php",
-                data={
-                    'action': 'send_telegram',
-                    'message': message
-                },
-                headers=self._form_headers(),
-                timeout=10
+            response = self._post_bots({
+                'action': 'send_telegram',
+                'message': message
+            }, self._timeouts['send_telegram'])
+            
+            return response.status_code == 200 and _json_body(response).get('sent', False)
+            
+        except Exception as e:
+            logger.debug(f"Send telegram error: {e}")
+            return False
+
+
+class AsyncStaffKitClient:
+    """
+    Cliente async de StaffKit (httpx, HTTP/2 si está disponible).
+    Para enviar muchos leads o checks a la vez con asyncio.gather:
+    
+        async with AsyncStaffKitClient() as client:
+            results = await client.save_leads_many(leads, list_id)
+    """
+    
+    def __init__(self, api_url: str = None, api_key: str = None):
+        if not HAS_HTTPX:
+            raise ImportError("AsyncStaffKitClient necesita httpx (pip install httpx)")
+        
+        self.api_url = (api_url or os.getenv('STAFFKIT_URL', '')).rstrip('/')
+        self.api_key = api_key or os.getenv('STAFFKIT_API_KEY', '')
+        self.timeout = int(os.getenv('STAFFKIT_TIMEOUT', '20'))
+        self.enabled = bool(self.api_url and self.api_key)
+        self._dup_cache = _DuplicateCache(int(os.getenv('STAFFKIT_DUP_TTL', '600')))
+        self._client = _httpx_client(
+            base_url=self.api_url,
+            headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'User-Agent': 'BotScrap-External/1.0'
+            },
+            timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=20)
+        )
+    
+    async def aclose(self):
+        """Cerrar las conexiones del cliente httpx"""
+        await self._client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def check_duplicate(self, domain: str) -> bool:
+        """Verificar si un dominio ya existe en StaffKit (False si falla)"""
+        if not self.enabled:
+            return False
+        
+        domain = normalize_domain(domain)
+        if not domain:
+            return False
+        cached = self._dup_cache.get(domain)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self._client.get('/api/v2/check-duplicate', params={'domain': domain})
+            if response.status_code != 200:
+                logger.warning(f"StaffKit API error: {response.status_code}")
+                return False
+            
+            exists = _json_body(response).get('exists', False)
+            self._dup_cache.put(domain, exists)
+            return exists
+            
+        except Exception as e:
+            logger.warning(f"StaffKit check failed: {e}")
+            return False
+    
+    async def save_lead(self, lead: Dict, list_id: int, bot_id: int = None, run_id: int = None) -> Dict:
+        """Guardar un lead (mismo resultado que StaffKitClient.save_lead)"""
+        if not self.enabled:
+            return {'success': False, 'status': 'disabled'}
+        
+        lead_data = _map_lead(lead)
+        
+        try:
+            response = await self._client.post(
+                '/api/bots.php',
+                content=_save_lead_body(lead_data, list_id, bot_id, run_id),
+                headers=_FORM_CONTENT_TYPE
             )
+            result = _save_lead_result(response, lead_data)
+            self._dup_cache.mark_saved(lead_data, result)
+            return result
             
-            return response.status_code == 200 and response.json().get('sent', False)
+        except Exception as e:
+            return {'success': False, 'status': 'error', 'error': str(e)}
+    
+    async def save_leads_many(self, leads: List[Dict], list_id: int, bot_id: int = None,
+                              run_id: int = None) -> List[Dict]:
+        """Guardar todos los leads en paralelo; un resultado por lead, en orden"""
+        # Como mucho tantas peticiones como conexiones del pool: el resto espera
+        # aquí y no en el pool de httpx (donde acabaría en PoolTimeout)
+        semaphore = asyncio.Semaphore(ASYNC_MAX_CONNECTIONS)
+        
+        async def save(lead: Dict) -> Dict:
+            async with semaphore:
+                return await self.save_lead(lead, list_id, bot_id, run_id)
+        
+        return await asyncio.gather(*(save(l) for l in leads))
+    
+    async def update_progress(self, run_id: int, leads_found: int = 0, leads_saved: int = 0,
+                              leads_duplicates: int = 0, status: str = None, error: str = None,
+                              current_action: str = None) -> bool:
+        """Actualizar progreso de ejecución en StaffKit"""
+        if not self.enabled or not run_id:
+            return False
+        
+        try:
+            response = await self._client.post(
+                '/api/bots.php',
+                data=_progress_data(run_id, leads_found, leads_saved, leads_duplicates,
+                                    status, error, current_action)
+            )
+            return response.status_code == 200
+            
+        except Exception as e:
+            logger.debug(f"Update progress error: {e}")
+            return False
+    
+    async def send_telegram(self, message: str) -> bool:
+        """Enviar mensaje via StaffKit (usa la config de Telegram de StaffKit)"""
+        if not self.enabled:
+            return False
+        
+        try:
+            response = await self._client.post(
+                '/api/bots.php',
+                data={'action': 'send_telegram', 'message': message}
+            )
+            return response.status_code == 200 and _json_body(response).get('sent', False)
             
         except Exception as e:
             logger.debug(f"Send telegram error: {e}")
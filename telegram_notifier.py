@@ -4,18 +4,52 @@ Telegram Notifier - Enviar notificaciones a Telegram
 """
 
 import os
+import html
+import json
+import time
+import queue
+import atexit
 import logging
+import threading
+import weakref
 import requests
 from typing import Optional
 
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, STAFFKIT_URL, STAFFKIT_API_KEY
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_COALESCE_SECS, STAFFKIT_URL, STAFFKIT_API_KEY
+)
 
 logger = logging.getLogger(__name__)
 
+# Config de Telegram obtenida de StaffKit, cacheada en disco entre ejecuciones
+CONFIG_CACHE_FILE = os.path.expanduser('~/.cache/botscrap/telegram.json')
+CONFIG_CACHE_TTL = 3600  # segundos
+CONFIG_RETRY_AFTER = 300  # segundos sin volver a pedirla si StaffKit no respondió
+
+COALESCE_WINDOW = 0.5  # segundos: mensajes seguidos se envían juntos
+MAX_MESSAGE_LEN = 4096  # Límite de texto de sendMessage
+LEADS_PER_MESSAGE = 20  # Leads por mensaje agrupado de notify_lead
+
+# Notificadores con hilo de envío: se vacían al salir con un único hook de
+# atexit (referencias débiles, no mantiene vivas las instancias)
+_active_notifiers = weakref.WeakSet()
+
+
+def _flush_all():
+    """Hook de atexit: enviar lo pendiente de todos los notificadores activos"""
+    for notifier in list(_active_notifiers):
+        notifier.flush()
+
+
+atexit.register(_flush_all)
+
 
 class TelegramNotifier:
     """Helper para enviar notificaciones a Telegram"""
     
+    __slots__ = ('token', 'chat_id', '_config_loaded', '_config_retry_at', '_q', '_sender',
+                 '_sender_lock', '_buffer', '_buffer_lock', '_buffer_timer', '__weakref__')
+    
     def __init__(self, token: str = None, chat_id: str = None):
         """
         Inicializar notificador
@@ -27,14 +61,52 @@ class TelegramNotifier:
         self.token = token or TELEGRAM_BOT_TOKEN
         self.chat_id = chat_id or TELEGRAM_CHAT_ID
         self._config_loaded = False
+        self._config_retry_at = 0.0  # Tras un fallo, no reintentar hasta entonces (monotonic)
+        
+        # Cola de mensajes y hilo de envío (se arranca en el primer send)
+        self._q = queue.Queue(maxsize=1000)
+        self._sender = None
+        self._sender_lock = threading.Lock()
         
-        # Intentar cargar config de StaffKit si no hay local
+        # Leads de notify_lead pendientes de enviar agrupados
+        self._buffer = []  # [(lead, bot_name)]
+        self._buffer_lock = threading.Lock()
+        self._buffer_timer = None
+        
+        # Sin config local: usar la de StaffKit cacheada en disco. Si no hay
+        # caché vigente, se pide a StaffKit en el primer send() (no al construir)
         if not self.token or not self.chat_id:
-            self._load_from_staffkit()
+            self._load_cached_config()
+    
+    def _load_cached_config(self):
+        """Cargar la config de StaffKit guardada en disco si no ha caducado"""
+        try:
+            with open(CONFIG_CACHE_FILE, 'r') as f:
+                cached = json.load(f)
+            if time.time() - cached['ts'] >= CONFIG_CACHE_TTL:
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        
+        self.token = self.token or cached.get('token')
+        self.chat_id = self.chat_id or cached.get('chat_id')
+        self._config_loaded = True
+    
+    def _save_cached_config(self, token: str, chat_id: str):
+        """Guardar en disco la config obtenida de StaffKit (contiene el token: 0600)"""
+        tmp_file = CONFIG_CACHE_FILE + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(CONFIG_CACHE_FILE), exist_ok=True)
+            fd = os.open(tmp_file, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'token': token, 'chat_id': chat_id, 'ts': time.time()}, f)
+            os.replace(tmp_file, CONFIG_CACHE_FILE)
+        except OSError as e:
+            logger.debug(f"Could not cache Telegram config: {e}")
     
     def _load_from_staffkit(self):
         """Cargar configuración de Telegram desde StaffKit API"""
-        if self._config_loaded:
+        if self._config_loaded or time.monotonic() < self._config_retry_at:
             return
         
         if not STAFFKIT_URL or not STAFFKIT_API_KEY:
@@ -55,11 +127,14 @@ class TelegramNotifier:
                 if data.get('enabled'):
                     self.token = data.get('token') or self.token
                     self.chat_id = data.get('chat_id') or self.chat_id
+                    self._save_cached_config(data.get('token'), data.get('chat_id'))
                     logger.info("✅ Telegram config loaded from StaffKit")
             
             self._config_loaded = True
             
         except Exception as e:
+            # Caché negativa: sin ella cada send() volvería a bloquear hasta 5 s
+            self._config_retry_at = time.monotonic() + CONFIG_RETRY_AFTER
             logger.debug(f"Could not load Telegram config from StaffKit: {e}")
     
     @property
@@ -69,19 +144,89 @@ class TelegramNotifier:
     
     def send(self, message: str, parse_mode: str = None) -> bool:
         """
-        Enviar mensaje a Telegram
+        Encolar mensaje para Telegram (lo envía un hilo en segundo plano,
+        así el bot no espera a api.telegram.org)
         
         Args:
             message: Mensaje a enviar
             parse_mode: 'HTML' o 'Markdown' (opcional)
             
         Returns:
-            True si se envió correctamente
+            True si se encoló correctamente
         """
+        if not self.enabled:
+            self._load_from_staffkit()
+        
         if not self.enabled:
             logger.debug("Telegram not configured, skipping notification")
             return False
         
+        self._start_sender()
+        try:
+            self._q.put_nowait((message, parse_mode))
+            return True
+        except queue.Full:
+            logger.warning("Telegram queue full, dropping message")
+            return False
+    
+    def flush(self, timeout: float = 10) -> bool:
+        """Enviar los leads agrupados pendientes y esperar a que se vacíe la cola (True si a tiempo)"""
+        self._flush_buffer()
+        deadline = time.monotonic() + timeout
+        with self._q.all_tasks_done:
+            while self._q.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._q.all_tasks_done.wait(remaining)
+        return True
+    
+    def _start_sender(self):
+        """Arrancar el hilo de envío la primera vez que se encola algo"""
+        with self._sender_lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._drain, name='telegram-sender', daemon=True)
+                self._sender.start()
+                _active_notifiers.add(self)
+    
+    def _drain(self):
+        """
+        Hilo de envío: agrupa los mensajes que llegan seguidos (dentro de
+        COALESCE_WINDOW y con el mismo parse_mode) en un solo sendMessage.
+        """
+        session = requests.Session()
+        
+        while True:
+            message, parse_mode = self._q.get()
+            parts = [message]
+            taken = 1
+            deadline = time.monotonic() + COALESCE_WINDOW
+            
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    next_message, next_mode = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                taken += 1
+                
+                joined_len = sum(len(p) + 2 for p in parts) + len(next_message)
+                if next_mode == parse_mode and joined_len <= MAX_MESSAGE_LEN:
+                    parts.append(next_message)
+                else:
+                    self._post(session, '\n\n'.join(parts), parse_mode)
+                    parts = [next_message]
+                    parse_mode = next_mode
+                    deadline = time.monotonic() + COALESCE_WINDOW
+            
+            self._post(session, '\n\n'.join(parts), parse_mode)
+            for _ in range(taken):
+                self._q.task_done()
+    
+    def _post(self, session: requests.Session, message: str, parse_mode: str = None) -> bool:
+        """Llamada real a sendMessage"""
         try:
             url = f"https://api.telegram.org/bot{self.token}/sendMessage"
             
@@ -93,7 +238,7 @@ class TelegramNotifier:
             if parse_mode:
                 data['parse_mode'] = parse_mode
             
-            response = requests.post(url, data=data, timeout=10)
+            response = session.post(url, data=data, timeout=10)
             
             if response.status_code == 200:
                 logger.debug("✅ Telegram message sent")
@@ -107,7 +252,47 @@ class TelegramNotifier:
             return False
     
     def notify_lead(self, lead: dict, bot_name: str = "Bot"):
-        """Notificar lead encontrado"""
+        """
+        Notificar lead encontrado. Los leads se agrupan durante
+        TELEGRAM_COALESCE_SECS y se envían juntos (evita el límite de Telegram)
+        """
+        if not self.enabled:
+            self._load_from_staffkit()
+        
+        if not self.enabled:
+            return
+        
+        with self._buffer_lock:
+            self._buffer.append((lead, bot_name))
+            if self._buffer_timer is None:
+                self._buffer_timer = threading.Timer(TELEGRAM_COALESCE_SECS, self._flush_buffer)
+                self._buffer_timer.daemon = True
+                self._buffer_timer.start()
+        # Asegura el flush en atexit aunque el timer no llegue a saltar
+        self._start_sender()
+    
+    def _flush_buffer(self):
+        """Enviar los leads acumulados: uno solo con el formato de siempre, varios en HTML"""
+        with self._buffer_lock:
+            pending, self._buffer = self._buffer, []
+            if self._buffer_timer is not None:
+                self._buffer_timer.cancel()
+                self._buffer_timer = None
+        
+        by_bot = {}
+        for lead, bot_name in pending:
+            by_bot.setdefault(bot_name, []).append(lead)
+        
+        for bot_name, leads in by_bot.items():
+            if len(leads) == 1:
+                self.send(self._lead_message(leads[0], bot_name))
+                continue
+            for i in range(0, len(leads), LEADS_PER_MESSAGE):
+                self.send(self._leads_html(leads[i:i + LEADS_PER_MESSAGE], bot_name), parse_mode='HTML')
+    
+    @staticmethod
+    def _lead_message(lead: dict, bot_name: str) -> str:
+        """Mensaje de un lead"""
         priority = lead.get('prioridad', lead.get('priority', 'media'))
         emoji = {'hot': '🔥', 'alta': '🔥', 'high': '🔥'}.get(priority, '⭐')
         
@@ -123,7 +308,26 @@ class TelegramNotifier:
         if lead.get('puntuacion', lead.get('score')):
             msg += f"📊 Score: {lead.get('puntuacion', lead.get('score'))}\n"
         
-        self.send(msg)
+        return msg
+    
+    @staticmethod
+    def _leads_html(leads: list, bot_name: str) -> str:
+        """Mensaje HTML compacto con varios leads"""
+        lines = [f"🆕 <b>{html.escape(bot_name)}</b> - {len(leads)} nuevos leads\n"]
+        for lead in leads:
+            priority = lead.get('prioridad', lead.get('priority', 'media'))
+            emoji = {'hot': '🔥', 'alta': '🔥', 'high': '🔥'}.get(priority, '⭐')
+            line = (
+                f"{emoji} {html.escape(str(lead.get('empresa', lead.get('company', 'N/A'))))}"
+                f" · {html.escape(str(lead.get('web', lead.get('website', 'N/A'))))}"
+            )
+            if lead.get('email'):
+                line += f" · {html.escape(lead['email'])}"
+            score = lead.get('puntuacion', lead.get('score'))
+            if score:
+                line += f" · {score}"
+            lines.append(line)
+        return "\n".join(lines)
     
     def notify_summary(self, stats: dict, bot_name: str = "Bot"):
         """Notificar resumen de ejecución"""
@@ -1,40 +1,80 @@
 #!/usr/bin/env python3
 """Contar emails corporativos vs genéricos"""
+import argparse
+import os
+import sys
 import requests
 import urllib3
-urllib3.disable_warnings()
+from concurrent.futures import ThreadPoolExecutor
 
-GENERIC_DOMAINS = {
+from sap_session import ensure_login
+from json_utils import json_body as jloads
+
+
+# PEM del certificado de SAP (SAP_CA_BUNDLE); sin él, sin verificar TLS
+SAP_CA_BUNDLE = os.getenv('SAP_CA_BUNDLE', '')
+if not SAP_CA_BUNDLE:
+    urllib3.disable_warnings()
+
+GENERIC_DOMAINS = frozenset(sys.intern(d) for d in (
     'gmail.com', 'hotmail.com', 'hotmail.es', 'outlook.com', 'outlook.es',
     'yahoo.com', 'yahoo.es', 'live.com', 'msn.com', 'icloud.com',
     'protonmail.com', 'mail.com', 'aol.com', 'zoho.com',
     'telefonica.net', 'orange.es', 'vodafone.es', 'movistar.es'
-}
+))
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--limit', type=int, default=None, help='Máximo de BP a analizar (por defecto, todos)')
+args = parser.parse_args()
 
 SAP_URL = 'https://verdis.artesap.com:50000/b1s/v1'
 session = requests.Session()
-session.verify = False
+session.verify = SAP_CA_BUNDLE or False
+# Respuestas comprimidas y sin anotaciones OData por entidad
+session.headers.update({
+    "Accept-Encoding": "gzip, deflate",
+    "Prefer": "odata.metadata=minimal"
+})
 
-session.post(f'{SAP_URL}/Login', json={'CompanyDB':'CLOUD_VERDIS_ES','UserName':'manager','Password':'9006'})
+if not ensure_login(session, SAP_URL, 'CLOUD_VERDIS_ES', 'manager', '9006'):
+    sys.exit(1)
 
 # Obtener todos los clientes del grupo 100 con email y activos
-all_bp = []
-skip = 0
-while True:
-    r = session.get(f'{SAP_URL}/BusinessPartners', 
-                   params={
-                       '$filter': "CardType eq 'cCustomer' and GroupCode eq 100 and EmailAddress ne '' and EmailAddress ne null and Valid eq 'tYES'",
-                       '$select': 'CardCode,CardName,EmailAddress',
-                       '$top': '100',
-                       '$skip': str(skip)
-                   })
-    data = r.json().get('value', [])
-    if not data:
-        break
-    all_bp.extend(data)
-    skip += 100
-    if skip > 1000:  # Limitar para el test
-        break
+PAGE_SIZE = 100
+PARAMS = {
+    '$filter': "CardType eq 'cCustomer' and GroupCode eq 100 and EmailAddress gt '' and Valid eq 'tYES'",
+    '$select': 'CardCode,CardName,EmailAddress',
+    '$top': str(PAGE_SIZE),
+}
+
+def fetch_page(skip, with_count=False):
+    params = dict(PARAMS, **{'$skip': str(skip)})
+    if with_count:
+        params['$inlinecount'] = 'allpages'
+    return jloads(session.get(f'{SAP_URL}/BusinessPartners', params=params))
+
+# Primera página: trae también el total para saber cuántas páginas pedir
+first = fetch_page(0, with_count=True)
+all_bp = first.get('value', [])
+count = first.get('odata.count', first.get('@odata.count'))
+
+if count is not None:
+    # Resto de páginas en paralelo (son independientes), en orden de skip
+    total = int(count) if args.limit is None else min(int(count), args.limit)
+    offsets = range(PAGE_SIZE, total, PAGE_SIZE)
+    if all_bp and offsets:
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            for data in executor.map(fetch_page, offsets):
+                all_bp.extend(data.get('value', []))
+else:
+    # Sin total: páginas en serie hasta una incompleta
+    page = all_bp
+    while len(page) == PAGE_SIZE and (args.limit is None or len(all_bp) < args.limit):
+        page = fetch_page(len(all_bp)).get('value', [])
+        all_bp.extend(page)
+
+if args.limit is not None:
+    del all_bp[args.limit:]
 
 print(f"Total BP activos con email (muestra): {len(all_bp)}")
 
@@ -43,15 +83,17 @@ corporate_count = 0
 corporate_examples = []
 
 for bp in all_bp:
-    email = bp.get('EmailAddress', '').lower()
-    if '@' in email:
-        domain = email.split('@')[-1]
-        if domain in GENERIC_DOMAINS:
-            generic_count += 1
-        else:
-            corporate_count += 1
-            if len(corporate_examples) < 10:
-                corporate_examples.append(f"{bp.get('CardCode')}: {bp.get('CardName')[:30]} | {email}")
+    email = bp.get('EmailAddress') or ''
+    at = email.rfind('@')
+    if at < 0:
+        continue
+    # Solo se pasa a minúsculas el dominio, sin partir el email en una lista
+    if email[at + 1:].lower() in GENERIC_DOMAINS:
+        generic_count += 1
+    else:
+        corporate_count += 1
+        if len(corporate_examples) < 10:
+            corporate_examples.append(f"{bp.get('CardCode')}: {bp.get('CardName')[:30]} | {email.lower()}")
 
 print(f"\nEmails genéricos (gmail, hotmail, etc): {generic_count}")
 print(f"Emails corporativos: {corporate_count}")
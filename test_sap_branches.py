@@ -12,6 +12,19 @@ SAP_CONFIG = {
     'password': 'web2'
 }
 
+FETCH_SIZE = 500
+
+
+def iter_rows(cursor, size=FETCH_SIZE):
+    """Recorre el resultado en bloques (fetchmany) en vez de cargarlo entero"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
 def main():
     print("Conectando a SAP Drasanvi...")
     conn = pymssql.connect(
@@ -23,6 +36,7 @@ def main():
         timeout=30
     )
     cursor = conn.cursor(as_dict=True)
+    cursor.arraysize = FETCH_SIZE
     print("Conectado!\n")
     
     # Ver branches disponibles en _WEB_Clientes
@@ -31,12 +45,12 @@ def main():
     print("=" * 60)
     cursor.execute("""
         SELECT Branch, COUNT(*) as total
-        FROM _WEB_Clientes
+        FROM _WEB_Clientes WITH (NOLOCK)
         WHERE Branch IS NOT NULL AND Branch != ''
         GROUP BY Branch
         ORDER BY total DESC
     """)
-    for row in cursor.fetchall():
+    for row in iter_rows(cursor):
         print(f"  {row['Branch']}: {row['total']} registros")
     
     # Ver algunos registros de ejemplo con email
@@ -46,12 +60,12 @@ def main():
     cursor.execute("""
         SELECT TOP 5
             w.CardCode, w.Branch, o.CardName, o.E_Mail, w.City
-        FROM _WEB_Clientes w
-        INNER JOIN OCRD o ON w.CardCode = o.CardCode
+        FROM _WEB_Clientes w WITH (NOLOCK)
+        INNER JOIN OCRD o WITH (NOLOCK) ON w.CardCode = o.CardCode
         WHERE o.E_Mail IS NOT NULL AND o.E_Mail != ''
           AND w.Branch LIKE '%FARM%'
     """)
-    for row in cursor.fetchall():
+    for row in iter_rows(cursor):
         print(f"  {row['CardCode']}: {row['CardName']}")
         print(f"    Branch: {row['Branch']}, Email: {row['E_Mail']}, City: {row['City']}")
     
@@ -62,12 +76,12 @@ def main():
     cursor.execute("""
         SELECT TOP 10
             w.CardCode, w.Branch, o.CardName, o.E_Mail, w.City
-        FROM _WEB_Clientes w
-        INNER JOIN OCRD o ON w.CardCode = o.CardCode
+        FROM _WEB_Clientes w WITH (NOLOCK)
+        INNER JOIN OCRD o WITH (NOLOCK) ON w.CardCode = o.CardCode
         WHERE o.E_Mail IS NOT NULL AND o.E_Mail != ''
         ORDER BY o.UpdateDate DESC
     """)
-    for row in cursor.fetchall():
+    for row in iter_rows(cursor):
         print(f"  {row['CardCode']}: {row['CardName']}")
         print(f"    Branch: {row['Branch']}, Email: {row['E_Mail']}")
     
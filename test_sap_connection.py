@@ -2,111 +2,108 @@
 """
 Test rápido de conexión SAP Service Layer
 """
-import requests
-import urllib3
-urllib3.disable_warnings()
+from concurrent.futures import ThreadPoolExecutor
 
-SAP_URL = "https://verdis.artesap.com:50000/b1s/v1"
-COMPANY = "CLOUD_VERDIS_ES"
-USER = "manager"
-PASSWORD = "9006"
+from sap_batch import batch_counts
+from sap_test_common import SAP_URL, jloads, sap_session
 
-session = requests.Session()
-session.verify = False
+# Conteos de diagnóstico (OData $filter, para el $batch de respaldo)
+COUNT_FILTERS = {
+    "Total BP (sin filtros)": None,
+    "BP en grupo 100": "GroupCode eq 100",
+    "BP grupo 100 + email": "GroupCode eq 100 and EmailAddress gt ''",
+}
 
-print("=" * 60)
-print("TEST CONEXIÓN SAP SERVICE LAYER")
-print("=" * 60)
+# Los mismos conteos en una sola consulta SQL guardada en SAP (SQLQueries)
+DIAG_QUERY = "BP_DIAG"
+DIAG_SQL = (
+    'SELECT COUNT(*) AS "total", '
+    'COUNT(CASE WHEN "GroupCode" = 100 THEN 1 END) AS "grp100", '
+    'COUNT(CASE WHEN "GroupCode" = 100 AND "E_Mail" <> \'\' THEN 1 END) AS "grp100_email" '
+    'FROM OCRD'
+)
+DIAG_COLUMNS = dict(zip(["total", "grp100", "grp100_email"], COUNT_FILTERS))
 
-# 1. Login
-print("\n1. Login...")
-try:
-    r = session.post(f"{SAP_URL}/Login", json={
-        "CompanyDB": COMPANY,
-        "UserName": USER,
-        "Password": PASSWORD
-    }, timeout=30)
-    if r.status_code == 200:
-        print(f"   ✅ Login OK")
-    else:
-        print(f"   ❌ Login FALLÓ: {r.status_code} - {r.text[:200]}")
-        exit(1)
-except Exception as e:
-    print(f"   ❌ Error conexión: {e}")
-    exit(1)
 
-# 2. Contar TODOS los BP
-print("\n2. Contando Business Partners...")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartners/$count", timeout=30)
-    print(f"   Total BP (sin filtros): {r.text}")
-except Exception as e:
-    print(f"   Error: {e}")
+def diag_counts(session) -> dict:
+    """Conteos con una sola SQLQuery (se registra la primera vez); si SL no la admite, $batch"""
+    list_url = f"{SAP_URL}/SQLQueries('{DIAG_QUERY}')/List"
+    r = session.get(list_url, timeout=30)
+    if r.status_code != 200:
+        session.post(f"{SAP_URL}/SQLQueries", json={
+            "SqlCode": DIAG_QUERY,
+            "SqlName": "Diagnóstico BusinessPartners",
+            "SqlText": DIAG_SQL
+        }, timeout=30)
+        r = session.get(list_url, timeout=30)
+    
+    rows = jloads(r).get('value') if r.status_code == 200 else None
+    if rows:
+        return {label: rows[0].get(column) for column, label in DIAG_COLUMNS.items()}
+    return batch_counts(session, SAP_URL, COUNT_FILTERS)
 
-# 3. Contar BP con email
-print("\n3. BP con email...")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartners/$count", 
-                   params={"$filter": "EmailAddress ne '' and EmailAddress ne null"},
-                   timeout=30)
-    print(f"   BP con email: {r.text}")
-except Exception as e:
-    print(f"   Error: {e}")
 
-# 4. Contar BP del grupo 100
-print("\n4. BP del grupo 100...")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartners/$count",
-                   params={"$filter": "GroupCode eq 100"},
-                   timeout=30)
-    print(f"   BP en grupo 100: {r.text}")
-except Exception as e:
-    print(f"   Error: {e}")
+def run(session):
+    """Conteos, ejemplos y grupos de BP"""
+    print("=" * 60)
+    print("TEST CONEXIÓN SAP SERVICE LAYER")
+    print("=" * 60)
 
-# 5. Contar BP del grupo 100 CON email
-print("\n5. BP del grupo 100 CON email...")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartners/$count",
-                   params={"$filter": "GroupCode eq 100 and EmailAddress ne '' and EmailAddress ne null"},
-                   timeout=30)
-    print(f"   BP grupo 100 + email: {r.text}")
-except Exception as e:
-    print(f"   Error: {e}")
+    # 1. Login (lo hace sap_session, reutilizando la cookie guardada si sigue viva)
+    print("\n1. Login...")
+    print(f"   ✅ Login OK")
 
-# 6. Ver ejemplos de BP con email
-print("\n6. Ejemplos de BP con email:")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartners",
-                   params={
-                       "$filter": "EmailAddress ne '' and EmailAddress ne null",
-                       "$select": "CardCode,CardName,EmailAddress,GroupCode,CardType",
-                       "$top": "10"
-                   },
-                   timeout=30)
-    data = r.json()
-    for bp in data.get('value', []):
-        email = bp.get('EmailAddress', '')
-        domain = email.split('@')[-1] if '@' in email else 'N/A'
-        print(f"   {bp.get('CardCode')}: {bp.get('CardName')[:30]:<30} | {email:<35} | Grupo: {bp.get('GroupCode')} | Tipo: {bp.get('CardType')}")
-except Exception as e:
-    print(f"   Error: {e}")
+    # Las consultas 2-7 son independientes: lanzarlas a la vez con la misma sesión
+    # (pool_maxsize del adapter >= max_workers); los resultados se muestran en orden
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        counts_future = executor.submit(diag_counts, session)
+        # BP con email: el total y los 10 primeros en la misma respuesta ($inlinecount)
+        examples_future = executor.submit(session.get, f"{SAP_URL}/BusinessPartners",
+                                          params={
+                                              "$filter": "EmailAddress gt ''",
+                                              "$select": "CardCode,CardName,EmailAddress,GroupCode,CardType",
+                                              "$inlinecount": "allpages",
+                                              "$top": "10"
+                                          },
+                                          headers={"Prefer": "odata.maxpagesize=10, odata.metadata=minimal"},
+                                          timeout=30)
+        groups_future = executor.submit(session.get, f"{SAP_URL}/BusinessPartnerGroups",
+                                        params={"$select": "Code,Name,Type"},
+                                        timeout=30)
 
-# 7. Ver grupos disponibles
-print("\n7. Grupos de clientes disponibles:")
-try:
-    r = session.get(f"{SAP_URL}/BusinessPartnerGroups",
-                   params={"$select": "Code,Name,Type"},
-                   timeout=30)
-    data = r.json()
-    for g in data.get('value', [])[:15]:
-        print(f"   {g.get('Code')}: {g.get('Name')} ({g.get('Type')})")
-except Exception as e:
-    print(f"   Error: {e}")
+    # 2-5. Conteos de BP: una sola consulta (SQLQuery o $batch)
+    print("\n2. Contando Business Partners...")
+    try:
+        counts = counts_future.result()
+        for label, count in counts.items():
+            print(f"   {label}: {count}")
+    except Exception as e:
+        print(f"   Error: {e}")
 
-# Logout
-try:
-    session.post(f"{SAP_URL}/Logout", timeout=5)
-except:
-    pass
+    # 6. BP con email y ejemplos
+    print("\n6. BP con email:")
+    try:
+        data = jloads(examples_future.result())
+        print(f"   Total: {data.get('odata.count', data.get('@odata.count', 'N/A'))}")
+        for bp in data.get('value', []):
+            email = bp.get('EmailAddress', '')
+            domain = email.split('@')[-1] if '@' in email else 'N/A'
+            print(f"   {bp.get('CardCode')}: {bp.get('CardName')[:30]:<30} | {email:<35} | Grupo: {bp.get('GroupCode')} | Tipo: {bp.get('CardType')}")
+    except Exception as e:
+        print(f"   Error: {e}")
 
-print("\n" + "=" * 60)
+    # 7. Ver grupos disponibles
+    print("\n7. Grupos de clientes disponibles:")
+    try:
+        data = jloads(groups_future.result())
+        for g in data.get('value', [])[:15]:
+            print(f"   {g.get('Code')}: {g.get('Name')} ({g.get('Type')})")
+    except Exception as e:
+        print(f"   Error: {e}")
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    with sap_session() as session:
+        run(session)
@@ -1,55 +1,57 @@
 #!/usr/bin/env python3
 """Test del filtro exacto del bot"""
-import requests
-import urllib3
-urllib3.disable_warnings()
-
-SAP_URL = 'https://verdis.artesap.com:50000/b1s/v1'
-session = requests.Session()
-session.verify = False
-
-# Login
-r = session.post(f'{SAP_URL}/Login', json={'CompanyDB':'CLOUD_VERDIS_ES','UserName':'manager','Password':'9006'})
-print('Login:', r.status_code)
-
-# Probar el filtro EXACTO que usa el bot
-filters = [
-    "CardType eq 'cCustomer'",
-    "(GroupCode eq 100)",
-    "EmailAddress ne ''",
-    "EmailAddress ne null",
-    "Valid eq 'tYES'"
-]
-filter_str = ' and '.join(filters)
-print(f'\nFiltro completo:')
-print(f'  {filter_str}')
-
-r = session.get(f'{SAP_URL}/BusinessPartners/$count', params={'$filter': filter_str})
-print(f'\nResultado con filtro completo: {r.text} (status: {r.status_code})')
-
-# Probar sin el filtro Valid
-filters2 = [
-    "CardType eq 'cCustomer'",
-    "(GroupCode eq 100)",
-    "EmailAddress ne ''",
-    "EmailAddress ne null"
-]
-filter_str2 = ' and '.join(filters2)
-r2 = session.get(f'{SAP_URL}/BusinessPartners/$count', params={'$filter': filter_str2})
-print(f'Sin filtro Valid: {r2.text} (status: {r2.status_code})')
-
-# Probar solo clientes del grupo 100
-r3 = session.get(f'{SAP_URL}/BusinessPartners/$count', 
-                params={'$filter': "CardType eq 'cCustomer' and GroupCode eq 100"})
-print(f'Solo clientes grupo 100: {r3.text} (status: {r3.status_code})')
-
-# Ver algunos ejemplos
-print('\nEjemplos de clientes grupo 100 con email:')
-r4 = session.get(f'{SAP_URL}/BusinessPartners', 
-                params={
-                    '$filter': "CardType eq 'cCustomer' and GroupCode eq 100 and EmailAddress ne '' and EmailAddress ne null",
-                    '$select': 'CardCode,CardName,EmailAddress,Valid',
-                    '$top': '5'
-                })
-for bp in r4.json().get('value', []):
-    print(f"  {bp.get('CardCode')}: {bp.get('CardName')[:40]:<40} | {bp.get('EmailAddress'):<30} | Valid: {bp.get('Valid')}")
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sap_batch import batch_counts
+from sap_test_common import SAP_URL, count, jloads, sap_session
+
+# Filtros precalculados. "EmailAddress gt ''" equivale a "ne '' and ne null"
+# (NULL no cumple ninguna comparación) y es el que usa ahora el bot
+BASE_FILTER = "CardType eq 'cCustomer' and (GroupCode eq 100)"
+CANONICAL_FILTER = f"{BASE_FILTER} and EmailAddress gt ''"
+LEGACY_FILTER = f"{BASE_FILTER} and EmailAddress ne '' and EmailAddress ne null"
+BOT_FILTER = f"{CANONICAL_FILTER} and Valid eq 'tYES'"  # Filtro EXACTO que usa el bot
+
+
+def run(session):
+    """Conteos con el filtro del bot y variantes"""
+    print(f'\nFiltro completo:')
+    print(f'  {BOT_FILTER}')
+
+    # Los tres conteos (una sola petición $batch) y los ejemplos, a la vez
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        counts_future = executor.submit(batch_counts, session, SAP_URL, {
+            'Resultado con filtro completo': BOT_FILTER,
+            'Sin filtro Valid': CANONICAL_FILTER,
+            'Solo clientes grupo 100': BASE_FILTER,
+        })
+        examples_future = executor.submit(session.get, f'{SAP_URL}/BusinessPartners',
+                                          params={
+                                              '$filter': CANONICAL_FILTER,
+                                              '$select': 'CardCode,CardName,EmailAddress,Valid',
+                                              '$top': '5'
+                                          })
+
+    print()
+    for label, value in counts_future.result().items():
+        print(f'{label}: {value}')
+
+    # Ver algunos ejemplos
+    print('\nEjemplos de clientes grupo 100 con email:')
+    r4 = examples_future.result()
+    for bp in jloads(r4).get('value', []):
+        print(f"  {bp.get('CardCode')}: {bp.get('CardName')[:40]:<40} | {bp.get('EmailAddress'):<30} | Valid: {bp.get('Valid')}")
+
+    # Comparar el coste del filtro de email: un predicado frente a dos (en serie,
+    # para que las latencias no se mezclen)
+    print('\nLatencia $count (email gt \'\' vs ne \'\' and ne null):')
+    for label, filter_str in (('gt', CANONICAL_FILTER), ('ne+ne', LEGACY_FILTER)):
+        start = time.perf_counter()
+        result = count(session, filter_str)
+        print(f'  {label:<6} {result:>8}  {(time.perf_counter() - start) * 1000:.0f} ms')
+
+
+if __name__ == "__main__":
+    with sap_session() as session:
+        run(session)
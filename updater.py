@@ -6,15 +6,40 @@ Sistema de actualizaciones automáticas via Git
 import os
 import subprocess
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
 
+# libgit2 en proceso (opcional): lecturas del repo sin lanzar git
+try:
+    import pygit2
+    HAS_PYGIT2 = True
+except ImportError:
+    HAS_PYGIT2 = False
+
 logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).parent
 
+# Subcomandos de solo lectura cuyo resultado se reutiliza unos segundos
+READ_ONLY_GIT = frozenset(['rev-parse', 'rev-list', 'log', 'status'])
+GIT_CACHE_TTL = 5.0
+
+# Segundos mínimos entre dos fetch al remoto (check_for_updates se consulta en bucle)
+FETCH_MIN_INTERVAL = 60.0
+
+# last_check legible (sin microsegundos). Los intervalos se miden con time.monotonic()
+ISO_FMT = '%Y-%m-%dT%H:%M:%S'
+
+# Entorno de git: sin prompts de credenciales (no hay terminal) y mensajes sin
+# traducir. Se parte del entorno actual: ssh-agent, proxies y HOME siguen haciendo falta
+GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT='0', LC_ALL='C')
+
+# Formato de git log: campos separados por NUL (no aparece en autor ni mensaje)
+LOG_FORMAT = '--format=%H%x00%h%x00%an%x00%ad%x00%s'
+
 
 @dataclass
 class Commit:
@@ -37,20 +62,74 @@ class UpdateInfo:
     last_check: str
 
 
+def _parse_commits(lines, limit: int = None) -> List[Commit]:
+    """Commits a partir de líneas LOG_FORMAT (se deja de leer al llegar a limit)"""
+    commits = []
+    for line in lines:
+        parts = line.split('\0', 4)
+        if len(parts) == 5:
+            commits.append(Commit(*parts))
+            if limit and len(commits) >= limit:
+                break
+    return commits
+
+
+def _commit_from_pygit2(commit) -> Commit:
+    """Commit a partir de un objeto pygit2 (mismos campos que LOG_FORMAT)"""
+    author = commit.author
+    date = datetime.fromtimestamp(author.time, timezone(timedelta(minutes=author.offset)))
+    return Commit(
+        hash=str(commit.id),
+        short_hash=commit.short_id,
+        author=author.name,
+        date=date.strftime('%Y-%m-%d'),
+        message=commit.message.partition('\n')[0].strip()
+    )
+
+
 class Updater:
     """Gestor de actualizaciones via Git"""
     
     def __init__(self, repo_path: str = None):
         self.repo_path = Path(repo_path) if repo_path else BASE_DIR
         self.remote = 'origin'
+        self._cache = {}  # {args: (timestamp, (success, output))}
+        self._last_fetch = None  # (monotonic, (success, output)) del último fetch
+        self._repo = None
+        if HAS_PYGIT2:
+            try:
+                self._repo = pygit2.Repository(str(self.repo_path))
+            except Exception as e:
+                logger.debug(f"pygit2 no disponible para {self.repo_path}: {e}")
         self.branch = self._get_current_branch()
     
     def _run_git(self, *args, capture_output: bool = True) -> Tuple[bool, str]:
+        """
+        Ejecutar comando git. Los de solo lectura se cachean GIT_CACHE_TTL
+        segundos; cualquier otro (fetch, pull, stash...) vacía la caché.
+        """
+        if not (capture_output and args and args[0] in READ_ONLY_GIT):
+            self._cache.clear()
+            return self._exec_git(*args, capture_output=capture_output)
+        
+        now = time.monotonic()
+        cached = self._cache.get(args)
+        if cached and now - cached[0] < GIT_CACHE_TTL:
+            return cached[1]
+        
+        result = self._exec_git(*args)
+        if result[0]:
+            self._cache[args] = (now, result)
+        return result
+    
+    def _exec_git(self, *args, capture_output: bool = True) -> Tuple[bool, str]:
         """Ejecutar comando git"""
         try:
             result = subprocess.run(
                 ['git'] + list(args),
                 cwd=str(self.repo_path),
+                env=GIT_ENV,
+                stdin=subprocess.DEVNULL,
                 capture_output=capture_output,
                 text=True,
                 timeout=30
@@ -68,25 +147,93 @@ class Updater:
         except Exception as e:
             return False, str(e)
     
+    def _run_git_stream(self, *args):
+        """Ejecutar comando git y devolver su salida línea a línea (sin cargarla entera)"""
+        try:
+            proc = subprocess.Popen(
+                ['git'] + list(args),
+                cwd=str(self.repo_path),
+                env=GIT_ENV,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True
+            )
+        except OSError as e:
+            logger.warning(f"git {args[0]} failed: {e}")
+            return
+        
+        try:
+            for line in proc.stdout:
+                yield line.rstrip('\n')
+        finally:
+            # Si se deja de leer antes, git termina al escribir en el pipe cerrado
+            proc.stdout.close()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+    
+    def _walk(self, tip: str, hide: str = None, limit: int = None) -> Optional[List[Commit]]:
+        """
+        Commits de `hide..tip` con pygit2 (orden de git log).
+        None si pygit2 no está o falla: el llamador usa git.
+        """
+        if self._repo is None:
+            return None
+        try:
+            walker = self._repo.walk(self._repo.revparse_single(tip).id, pygit2.GIT_SORT_TIME)
+            if hide:
+                walker.hide(self._repo.revparse_single(hide).id)
+            commits = []
+            for commit in walker:
+                commits.append(_commit_from_pygit2(commit))
+                if limit and len(commits) >= limit:
+                    break
+            return commits
+        except Exception as e:
+            logger.debug(f"pygit2 walk {hide}..{tip} failed: {e}")
+            return None
+    
+    def _head(self) -> Tuple[Optional[str], Optional[str]]:
+        """(hash completo, rama) del HEAD, con pygit2 o con una sola llamada a git"""
+        if self._repo is not None:
+            try:
+                head = self._repo.head
+                return str(head.target), head.shorthand
+            except Exception:
+                pass
+        
+        success, output = self._run_git('rev-parse', 'HEAD', '--abbrev-ref', 'HEAD')
+        lines = output.split('\n') if success else []
+        if len(lines) != 2:
+            return None, None
+        return lines[0], lines[1]
+    
     def _get_current_branch(self) -> str:
         """Obtener rama actual"""
-        success, output = self._run_git('rev-parse', '--abbrev-ref', 'HEAD')
-        return output if success else 'main'
+        return self._head()[1] or 'main'
     
     def get_current_version(self) -> str:
         """Obtener hash del commit actual"""
-        success, output = self._run_git('rev-parse', '--short', 'HEAD')
-        return output if success else 'unknown'
+        full_hash = self._head()[0]
+        return full_hash[:7] if full_hash else 'unknown'
     
     def get_current_version_full(self) -> str:
         """Obtener hash completo del commit actual"""
-        success, output = self._run_git('rev-parse', 'HEAD')
-        return output if success else 'unknown'
+        return self._head()[0] or 'unknown'
     
     def fetch_updates(self) -> Tuple[bool, str]:
-        """Descargar información de actualizaciones del remoto"""
+        """Descargar información de actualizaciones del remoto (como mucho cada FETCH_MIN_INTERVAL)"""
+        now = time.monotonic()
+        if self._last_fetch and now - self._last_fetch[0] < FETCH_MIN_INTERVAL:
+            return self._last_fetch[1]
+        
         logger.info(f"Fetching updates from {self.remote}/{self.branch}...")
-        return self._run_git('fetch', self.remote, self.branch)
+        result = self._run_git('fetch', '--no-tags', self.remote, self.branch)
+        self._last_fetch = (now, result)
+        return result
     
     def check_for_updates(self) -> UpdateInfo:
         """
@@ -106,44 +253,31 @@ class Updater:
                 commits_behind=0,
                 commits=[],
                 has_updates=False,
-                last_check=datetime.now().isoformat()
+                last_check=datetime.now().strftime(ISO_FMT)
             )
         
-        # Obtener versión actual
-        current = self.get_current_version()
+        upstream = f'{self.remote}/{self.branch}'
         
-        # Obtener versión remota
-        success, remote_hash = self._run_git('rev-parse', '--short', f'{self.remote}/{self.branch}')
-        latest = remote_hash if success else current
-        
-        # Contar commits detrás
-        success, count = self._run_git(
-            'rev-list', '--count', 
-            f'HEAD..{self.remote}/{self.branch}'
-        )
-        commits_behind = int(count) if success and count.isdigit() else 0
-        
-        # Obtener lista de commits nuevos
-        commits = []
-        if commits_behind > 0:
-            success, log_output = self._run_git(
-                'log', '--oneline', '--format=%H|%h|%an|%ad|%s',
-                '--date=short',
-                f'HEAD..{self.remote}/{self.branch}'
-            )
+        # Commits nuevos (son también los commits detrás): pygit2 en proceso, o git log
+        commits = self._walk(upstream, hide='HEAD')
+        if commits is not None:
+            current = self.get_current_version()
+            latest = str(self._repo.revparse_single(upstream).id)[:7]
+        else:
+            # Versión actual y remota con una sola llamada (hashes completos)
+            success, output = self._run_git('rev-parse', 'HEAD', upstream)
+            hashes = output.split('\n') if success else []
+            if len(hashes) == 2:
+                current, latest = hashes[0][:7], hashes[1][:7]
+            else:
+                current = latest = self.get_current_version()
             
-            if success and log_output:
-                for line in log_output.split('\n'):
-                    if line and '|' in line:
-                        parts = line.split('|', 4)
-                        if len(parts) >= 5:
-                            commits.append(Commit(
-                                hash=parts[0],
-                                short_hash=parts[1],
-                                author=parts[2],
-                                date=parts[3],
-                                message=parts[4]
-                            ))
+            commits = _parse_commits(self._run_git_stream(
+                'log', LOG_FORMAT,
+                '--date=short',
+                f'HEAD..{upstream}'
+            ))
+        commits_behind = len(commits)
         
         return UpdateInfo(
             current_version=current,
@@ -151,7 +285,7 @@ class Updater:
             commits_behind=commits_behind,
             commits=commits,
             has_updates=commits_behind > 0,
-            last_check=datetime.now().isoformat()
+            last_check=datetime.now().strftime(ISO_FMT)
         )
     
     def get_local_changes(self) -> Tuple[bool, List[str]]:
@@ -166,7 +300,7 @@ class Updater:
     
     def stash_changes(self) -> Tuple[bool, str]:
         """Guardar cambios locales en stash"""
-        return self._run_git('stash', 'push', '-m', f'Auto-stash before update {datetime.now().isoformat()}')
+        return self._run_git('stash', 'push', '-m', f'Auto-stash before update {int(time.time())}')
     
     def pull_updates(self, force: bool = False) -> Tuple[bool, str]:
         """
@@ -202,28 +336,16 @@ class Updater:
     
     def get_changelog(self, from_version: str = None, limit: int = 20) -> List[Commit]:
         """Obtener historial de cambios"""
-        args = ['log', '--oneline', '--format=%H|%h|%an|%ad|%s', '--date=short', f'-{limit}']
+        commits = self._walk('HEAD', hide=from_version, limit=limit)
+        if commits is not None:
+            return commits
+        
+        args = ['log', LOG_FORMAT, '--date=short', f'-{limit}']
         
         if from_version:
             args.append(f'{from_version}..HEAD')
         
-        success, output = self._run_git(*args)
-        
-        commits = []
-        if success and output:
-            for line in output.split('\n'):
-                if line and '|' in line:
-                    parts = line.split('|', 4)
-                    if len(parts) >= 5:
-                        commits.append(Commit(
-                            hash=parts[0],
-                            short_hash=parts[1],
-                            author=parts[2],
-                            date=parts[3],
-                            message=parts[4]
-                        ))
-        
-        return commits
+        return _parse_commits(self._run_git_stream(*args), limit)
     
     def get_status(self) -> dict:
         """Obtener estado general del repositorio"""
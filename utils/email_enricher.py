@@ -6,11 +6,17 @@ Reciclado del botscrap original para botscrap_external
 
 import re
 import os
+import codecs
 import logging
-from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +47,92 @@ IGNORE_EMAILS = [
     'wordpress', 'webmaster@wordpress', 'privacy@', 'abuse@'
 ]
 
+# Páginas de contacto que se revisan (en paralelo con la principal)
+CONTACT_PATHS = ['/contacto', '/contact', '/contactanos', '/contact-us', '/sobre-nosotros', '/about']
+MAX_CONTACT_PAGES = 3
+
+# Límites del escaneo de HTML: solo se usan los ~5 mejores emails por lead
+MAX_EMAILS_PER_PAGE = 20
+HTML_CHUNK_SIZE = 64 * 1024  # Lectura en streaming de las páginas
+MAX_HTML_BYTES = 1024 * 1024 # Se corta la descarga pasado este tamaño
+EMAIL_CARRY = 128            # Texto que se arrastra entre trozos (email partido)
+
+# Caracteres de la parte local y del dominio de un email
+_LOCAL = r'[a-z0-9._%+-]'
+_DOMAIN = r'[a-z0-9.-]'
+
+# Regex compiladas una vez (se usan por cada email de cada lead)
+# EMAIL_RE extrae y valida en una pasada: el lookahead descarta IGNORE_EMAILS en la
+# parte local (o local@dominio para los que llevan '@') y las longitudes acotadas
+# (64/253, límites del RFC) evitan que un texto largo sin '@' se reescanee entero
+# desde cada posición. En el dominio se comprueba sobre el grupo 'domain' ya
+# casado (IGNORE_DOMAIN_RE): un lookahead no sabe dónde acaba el dominio
+EMAIL_RE = re.compile(
+    rf'(?<!{_LOCAL})'
+    rf'(?!{_LOCAL}{{0,64}}?(?:{"|".join(re.escape(s) for s in IGNORE_EMAILS)}))'
+    rf'(?P<local>{_LOCAL}{{1,64}})@'
+    rf'(?P<domain>{_DOMAIN}{{1,253}}\.[a-z]{{2,}})',
+    re.IGNORECASE
+)
+IGNORE_DOMAIN_RE = re.compile(
+    '|'.join(re.escape(s) for s in IGNORE_EMAILS if '@' not in s), re.IGNORECASE
+)
+PERSONAL_DOT_RE = re.compile(r'^[a-z]+\.[a-z]+$')     # nombre.apellido
+PERSONAL_PLAIN_RE = re.compile(r'^[a-z]{2,}$')       # nombre
+ALL_PATTERN_SET = frozenset(p for patterns in EMAIL_PATTERNS.values() for p in patterns)
+
+# Tipo por patrón en un solo match: una rama (lookahead) por tipo en el orden de
+# EMAIL_PATTERNS, así gana el primer tipo con algún patrón en la parte local (m.lastgroup)
+PATTERN_RE = re.compile('|'.join(
+    f"(?P<{tipo}>(?=.*?(?:{'|'.join(re.escape(p) for p in patterns)})))"
+    for tipo, patterns in EMAIL_PATTERNS.items()
+))
+
+
+class EmailCand:
+    """Email candidato (con __slots__: sin dict por instancia)"""
+    __slots__ = ('email', 'tipo', 'prioridad', 'fuente', 'verificado', 'nombre', 'cargo')
+    
+    def __init__(self, email: str, tipo: str, prioridad: int, fuente: str,
+                 verificado: bool = False, nombre: str = '', cargo: str = ''):
+        self.email = email
+        self.tipo = tipo
+        self.prioridad = prioridad
+        self.fuente = fuente
+        self.verificado = verificado
+        self.nombre = nombre
+        self.cargo = cargo
+    
+    def to_dict(self) -> Dict:
+        """Formato dict de 'todos_emails' en el resultado"""
+        return {
+            'email': self.email,
+            'tipo': self.tipo,
+            'prioridad': self.prioridad,
+            'fuente': self.fuente,
+            'verificado': self.verificado
+        }
+
+
+@lru_cache(maxsize=4096)
+def _classify_email_cached(email: str) -> str:
+    """Clasificar tipo de email (función pura: cacheada por email)"""
+    local_part = email.split('@')[0].lower()
+    
+    # Personal (nombre.apellido)
+    if PERSONAL_DOT_RE.match(local_part):
+        return 'personal'
+    if PERSONAL_PLAIN_RE.match(local_part) and len(local_part) > 3:
+        if local_part not in ALL_PATTERN_SET:
+            return 'personal'
+    
+    # Por patrones
+    m = PATTERN_RE.match(local_part)
+    if m:
+        return m.lastgroup
+    
+    return 'unknown'
+
 
 class EmailEnricher:
     """Enriquecedor de emails para leads"""
@@ -56,6 +148,14 @@ class EmailEnricher:
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        # Pool amplio: cada lead es un host distinto y sus páginas se piden en paralelo
+        adapter = HTTPAdapter(
+            pool_connections=50,
+            pool_maxsize=50,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
         return session
     
     def enrich_emails(self, website: str, empresa: str = '') -> Dict:
@@ -76,24 +176,37 @@ class EmailEnricher:
             return self._empty_result()
         
         all_emails = []
+        base_url = self._base_url(website)
         
-        # 1. Scraping de la web principal
-        web_emails = self._scrape_website_emails(website)
-        all_emails.extend(web_emails)
-        
-        # 2. Scraping de página de contacto
-        contact_emails = self._scrape_contact_page(website)
-        all_emails.extend(contact_emails)
+        # Peticiones HTTP en paralelo (web principal, contacto y Apollo);
+        # los resultados se recogen en orden fijo para que la deduplicación no varíe
+        with ThreadPoolExecutor(max_workers=1 + MAX_CONTACT_PAGES) as executor:
+            # 3. Apollo.io Org Enrichment (si hay API key - obtener teléfono)
+            apollo_future = executor.submit(self._apollo_org_enrich, domain) if self.apollo_key else None
+            
+            # 1. Scraping de la web principal
+            web_emails = self._scrape_website_emails(website)
+            all_emails.extend(web_emails)
+            
+            # 2. Scraping de páginas de contacto, salvo si la principal ya dio
+            # un email personal o comercial
+            best_priority = min((e.prioridad for e in web_emails), default=EMAIL_PRIORITY['unknown'])
+            if best_priority > EMAIL_PRIORITY['comercial']:
+                contact_futures = [
+                    executor.submit(self._scrape_contact_path, base_url, path)
+                    for path in CONTACT_PATHS[:MAX_CONTACT_PAGES]
+                ]
+                for future in contact_futures:
+                    all_emails.extend(future.result())
         
-        # 3. Generar patrones comunes
+        # 4. Generar patrones comunes
         pattern_emails = self._generate_pattern_emails(domain)
         all_emails.extend(pattern_emails)
         
-        # 4. Apollo.io Org Enrichment (si hay API key - obtener teléfono)
         phone = ''
         apollo_data = {}
-        if self.apollo_key:
-            phone, apollo_data = self._apollo_org_enrich(domain)
+        if apollo_future:
+            phone, apollo_data = apollo_future.result()
         
         # 5. Deduplicar y priorizar
         unique_emails = self._deduplicate_emails(all_emails)
@@ -115,70 +228,56 @@ class EmailEnricher:
         except:
             return ''
     
-    def _scrape_website_emails(self, website: str) -> List[Dict]:
+    def _base_url(self, website: str) -> str:
+        """URL con esquema y sin barra final"""
+        url = website if website.startswith('http') else f'https://{website}'
+        return url.rstrip('/')
+    
+    def _scrape_website_emails(self, website: str) -> List[EmailCand]:
         """Extraer emails de la página principal"""
         emails = []
         try:
             url = website if website.startswith('http') else f'https://{website}'
-            response = self.session.get(url, timeout=self.timeout, verify=False)
-            
-            found = self._extract_emails_from_html(response.text)
+            with self.session.get(url, timeout=self.timeout, verify=False, stream=True) as response:
+                found = self._extract_emails_from_html(self._iter_html(response))
             for email in found:
-                emails.append({
-                    'email': email.lower(),
-                    'tipo': self._classify_email(email),
-                    'prioridad': EMAIL_PRIORITY.get(self._classify_email(email), 7),
-                    'fuente': 'web_principal',
-                    'verificado': False
-                })
+                tipo = self._classify_email(email)
+                emails.append(EmailCand(email, tipo, EMAIL_PRIORITY.get(tipo, 7), 'web_principal'))
                 
         except Exception as e:
             logger.debug(f"Error scraping {website}: {e}")
         
         return emails
     
-    def _scrape_contact_page(self, website: str) -> List[Dict]:
-        """Buscar emails en páginas de contacto"""
+    def _scrape_contact_path(self, base_url: str, path: str) -> List[EmailCand]:
+        """Buscar emails en una página de contacto (base_url + path)"""
         emails = []
-        contact_paths = ['/contacto', '/contact', '/contactanos', '/contact-us', '/sobre-nosotros', '/about']
-        
-        base_url = website if website.startswith('http') else f'https://{website}'
-        base_url = base_url.rstrip('/')
-        
-        for path in contact_paths[:3]:
-            try:
-                url = f"{base_url}{path}"
-                response = self.session.get(url, timeout=self.timeout, allow_redirects=True, verify=False)
-                
-                if response.status_code == 200:
-                    found = self._extract_emails_from_html(response.text)
-                    for email in found:
-                        emails.append({
-                            'email': email.lower(),
-                            'tipo': self._classify_email(email),
-                            'prioridad': EMAIL_PRIORITY.get(self._classify_email(email), 7),
-                            'fuente': f'web_{path.strip("/")}',
-                            'verificado': False
-                        })
-            except:
-                continue
+        try:
+            url = f"{base_url}{path}"
+            with self.session.get(url, timeout=self.timeout, allow_redirects=True,
+                                  verify=False, stream=True) as response:
+                if response.status_code != 200:
+                    return emails
+                found = self._extract_emails_from_html(self._iter_html(response))
+            
+            fuente = f'web_{path.strip("/")}'
+            for email in found:
+                tipo = self._classify_email(email)
+                emails.append(EmailCand(email, tipo, EMAIL_PRIORITY.get(tipo, 7), fuente))
+        except Exception as e:
+            logger.debug(f"Error scraping {base_url}{path}: {e}")
         
         return emails
     
-    def _generate_pattern_emails(self, domain: str) -> List[Dict]:
+    def _generate_pattern_emails(self, domain: str) -> List[EmailCand]:
         """Generar emails basados en patrones comunes"""
         emails = []
         common_patterns = ['info', 'contacto', 'hola', 'ventas', 'comercial']
         
         for pattern in common_patterns:
             email = f"{pattern}@{domain}"
-            emails.append({
-                'email': email,
-                'tipo': self._classify_email(email),
-                'prioridad': EMAIL_PRIORITY.get(self._classify_email(email), 7) + 1,
-                'fuente': 'pattern',
-                'verificado': False
-            })
+            tipo = self._classify_email(email)
+            emails.append(EmailCand(email, tipo, EMAIL_PRIORITY.get(tipo, 7) + 1, 'pattern'))
         
         return emails
     
@@ -219,110 +318,119 @@ class EmailEnricher:
         
         return '', {}
     
-    def _extract_emails_from_html(self, html: str) -> List[str]:
-        """Extraer emails de HTML"""
-        emails = []
-        
-        # mailto: links
-        mailto_pattern = r'mailto:([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
-        emails.extend(re.findall(mailto_pattern, html))
+    def _iter_html(self, response) -> Iterator[str]:
+        """
+        Texto de una respuesta pedida con stream=True, en trozos. Pasados
+        MAX_HTML_BYTES se cierra la conexión (volcados, bundles de 10MB...)
+        """
+        try:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
         
-        # Emails en texto
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        emails.extend(re.findall(email_pattern, html))
+        read = 0
+        for chunk in response.iter_content(chunk_size=HTML_CHUNK_SIZE):
+            read += len(chunk)
+            if read >= MAX_HTML_BYTES:
+                yield decoder.decode(chunk[:len(chunk) - (read - MAX_HTML_BYTES)], final=True)
+                response.close()
+                return
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+    
+    def _extract_emails_from_html(self, html: Union[str, Iterable[str]]) -> List[str]:
+        """Extraer emails de HTML (texto o trozos de texto); ya en minúsculas"""
+        if isinstance(html, str):
+            html = (html,)
         
+        # Una sola pasada: el patrón de texto ya captura los de los enlaces mailto:
+        # (':' no entra en la parte local, el match empieza tras 'mailto:')
         # Filtrar y deduplicar
         valid_emails = []
         seen = set()
-        for email in emails:
-            email_lower = email.lower()
-            if email_lower not in seen and self._is_valid_email(email):
-                valid_emails.append(email)
-                seen.add(email_lower)
+        tail = ''
+        for chunk in chain(html, (None,)):
+            if chunk is None:
+                # Fin del texto: lo arrastrado ya no puede continuar
+                text, cut = tail, len(tail)
+            else:
+                text = tail + chunk
+                cut = max(len(text) - EMAIL_CARRY, 0)
+            tail = text[cut:]
+            
+            for m in EMAIL_RE.finditer(text):
+                if m.end() > cut:
+                    # Puede seguir en el siguiente trozo: se escanea de nuevo con él
+                    tail = text[m.start():]
+                    break
+                if IGNORE_DOMAIN_RE.search(m.group('domain')):
+                    continue
+                # El match ya es un email válido y no ignorado
+                email = m.group().lower()
+                if email not in seen:
+                    valid_emails.append(email)
+                    seen.add(email)
+                    if len(valid_emails) >= MAX_EMAILS_PER_PAGE:
+                        return valid_emails
         
         return valid_emails
     
-    def _is_valid_email(self, email: str) -> bool:
-        """Verificar si un email es válido"""
-        email_lower = email.lower()
-        
-        if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
-            return False
-        
-        for ignore in IGNORE_EMAILS:
-            if ignore in email_lower:
-                return False
-        
-        return True
-    
     def _classify_email(self, email: str) -> str:
         """Clasificar tipo de email"""
-        local_part = email.split('@')[0].lower()
-        
-        # Personal (nombre.apellido)
-        if re.match(r'^[a-z]+\.[a-z]+$', local_part):
-            return 'personal'
-        if re.match(r'^[a-z]{2,}$', local_part) and len(local_part) > 3:
-            is_pattern = any(local_part in patterns for patterns in EMAIL_PATTERNS.values())
-            if not is_pattern:
-                return 'personal'
-        
-        # Por patrones
-        for tipo, patterns in EMAIL_PATTERNS.items():
-            if any(p in local_part for p in patterns):
-                return tipo
-        
-        return 'unknown'
+        return _classify_email_cached(email)
     
-    def _deduplicate_emails(self, emails: List[Dict]) -> List[Dict]:
-        """Eliminar duplicados"""
-        seen = {}
-        for email_data in emails:
-            email = email_data['email'].lower()
-            if email not in seen:
-                seen[email] = email_data
-            else:
-                existing = seen[email]
-                if email_data['fuente'] != 'pattern' and existing['fuente'] == 'pattern':
-                    seen[email] = email_data
-                elif email_data.get('verificado') and not existing.get('verificado'):
-                    seen[email] = email_data
+    def _deduplicate_emails(self, emails: List[EmailCand]) -> List[EmailCand]:
+        """Eliminar duplicados: por email se queda el verificado y, si no, el no-pattern"""
+        def rank(e):
+            return (0 if e.verificado else 1, 0 if e.fuente != 'pattern' else 1)
+        
+        # Ordenar por (email, calidad) y quedarse con el primero de cada email;
+        # el índice desempata como antes (el primero encontrado) y mantiene
+        # el orden de descubrimiento en el resultado
+        ranked = sorted(enumerate(emails), key=lambda ie: (ie[1].email, rank(ie[1]), ie[0]))
+        unique = []
+        last_email = None
+        for index, email_data in ranked:
+            if email_data.email != last_email:
+                unique.append((index, email_data))
+                last_email = email_data.email
         
-        return list(seen.values())
+        unique.sort(key=lambda ie: ie[0])
+        return [email_data for _, email_data in unique]
     
-    def _prioritize_emails(self, emails: List[Dict]) -> List[Dict]:
+    def _prioritize_emails(self, emails: List[EmailCand]) -> List[EmailCand]:
         """Ordenar por prioridad"""
         def sort_key(e):
-            verified_score = 0 if e.get('verificado') else 1
-            source_score = 0 if e['fuente'] != 'pattern' else 1
-            return (verified_score, e['prioridad'], source_score)
+            verified_score = 0 if e.verificado else 1
+            source_score = 0 if e.fuente != 'pattern' else 1
+            return (verified_score, e.prioridad, source_score)
         
         return sorted(emails, key=sort_key)
     
-    def _build_result(self, prioritized_emails: List[Dict], phone: str = '', apollo_data: dict = None) -> Dict:
+    def _build_result(self, prioritized_emails: List[EmailCand], phone: str = '', apollo_data: dict = None) -> Dict:
         """Construir resultado final"""
         if not prioritized_emails and not phone:
             return self._empty_result()
         
         if prioritized_emails:
             principal = prioritized_emails[0]
-            adicionales = [e['email'] for e in prioritized_emails[1:5]]
+            adicionales = [e.email for e in prioritized_emails[1:5]]
             
             # Calcular confianza
             confianza = 50
-            if principal.get('verificado'):
+            if principal.verificado:
                 confianza += 30
-            if principal['fuente'] != 'pattern':
+            if principal.fuente != 'pattern':
                 confianza += 15
-            if principal['tipo'] == 'personal':
+            if principal.tipo == 'personal':
                 confianza += 5
             
             return {
-                'email_principal': principal['email'],
+                'email_principal': principal.email,
                 'emails_adicionales': adicionales,
-                'email_tipo': principal['tipo'],
+                'email_tipo': principal.tipo,
                 'confianza': min(confianza, 100),
-                'todos_emails': prioritized_emails,
+                'todos_emails': [e.to_dict() for e in prioritized_emails],
                 'phone': phone,
                 'apollo_data': apollo_data or {}
             }
@@ -293,8 +293,8 @@ def api_lists():
     from staffkit_client import StaffKitClient
     from config import STAFFKIT_LIST_ID
     
-    client = StaffKitClient()
-    lists = client.get_lists()
+    with StaffKitClient() as client:
+        lists = client.get_lists()
     
     return jsonify({
         'lists': lists,
@@ -389,8 +389,8 @@ def api_test_connection():
     """API: Test de conexión con StaffKit"""
     from staffkit_client import StaffKitClient
     
-    client = StaffKitClient()
-    result = client.test_connection()
+    with StaffKitClient() as client:
+        result = client.test_connection()
     
     return jsonify(result)
 